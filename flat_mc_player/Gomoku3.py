@@ -5,6 +5,7 @@
 from gtp_connection import GtpConnection
 from board_util import GoBoardUtil, EMPTY
 from simple_board import SimpleGoBoard
+from batch_playout import batch_rollout
 
 import random
 import numpy as np
@@ -32,12 +33,16 @@ class GomokuSimulationPlayer(object):
     For each move do `n_simualtions_per_move` playouts,
     then select the one with best win-rate.
     playout could be either random or rule_based (i.e., uses pre-defined patterns) 
+    With the random policy, batch_size > 1 runs that many playouts of a move
+    at once with batch_rollout.
     """
-    def __init__(self, n_simualtions_per_move=10, playout_policy='random', board_size=7):
+    def __init__(self, n_simualtions_per_move=10, playout_policy='random', board_size=7, batch_size=1):
         assert(playout_policy in ['random', 'rule_based'])
+        assert(batch_size >= 1)
         self.n_simualtions_per_move=n_simualtions_per_move
         self.board_size=board_size
         self.playout_policy=playout_policy
+        self.batch_size=batch_size
 
         #NOTE: pattern has preference, later pattern is ignored if an earlier pattern is found
         self.pattern_list=['Win', 'BlockWin', 'OpenFour', 'BlockOpenFour', 'Random']
@@ -50,6 +55,10 @@ class GomokuSimulationPlayer(object):
         assert(playout_policy in ['random', 'rule_based'])
         self.playout_policy=playout_policy
 
+    def set_batch_size(self, batch_size=1):
+        assert(batch_size >= 1)
+        self.batch_size=batch_size
+
     def _random_moves(self, board, color_to_play):
         return GoBoardUtil.generate_legal_moves_gomoku(board)
     
@@ -84,6 +93,16 @@ class GomokuSimulationPlayer(object):
             assert(res == GoBoardUtil.opponent(color_to_play))
             return -1.0
 
+    def _do_batch_playout(self, board, color_to_play, batch_size):
+        """
+        Random playouts of batch_size games at once.
+        Returns the sum of their results, scored as in _do_playout.
+        """
+        winners, _ = batch_rollout(board, batch_size)
+        wins = np.count_nonzero(winners == color_to_play)
+        losses = np.count_nonzero(winners == GoBoardUtil.opponent(color_to_play))
+        return float(wins - losses)
+
     def get_move(self, board, color_to_play):
         """
         The genmove function called by gtp_connection
@@ -94,6 +113,7 @@ class GomokuSimulationPlayer(object):
         best_move=moves[0]
         wins = np.zeros(len(moves))
         visits = np.zeros(len(moves))
+        batch_size = self.batch_size if self.playout_policy == 'random' else 1
         while True:
             for i, move in enumerate(moves):
                 play_move(board, move, toplay)
@@ -103,9 +123,12 @@ class GomokuSimulationPlayer(object):
                     #This move is a immediate win
                     self.best_move=move
                     return move
-                ret=self._do_playout(board, toplay)
+                if batch_size > 1:
+                    ret=self._do_batch_playout(board, toplay, batch_size)
+                else:
+                    ret=self._do_playout(board, toplay)
                 wins[i] += ret
-                visits[i] += 1
+                visits[i] += batch_size
                 win_rate = wins[i] / visits[i]
                 if win_rate > best_result:
                     best_result=win_rate
@@ -56,7 +56,8 @@ class GtpConnection():
             "solve": self.solve_cmd,
             "list_solve_point": self.list_solve_point_cmd, # below is added for Gomoku3
             "policy": self.set_playout_policy, 
-            "policy_moves": self.display_pattern_moves
+            "policy_moves": self.display_pattern_moves,
+            "batch_size": self.set_batch_size
         }
         self.timelimit=2
 
@@ -70,7 +71,8 @@ class GtpConnection():
             "genmove": (1, 'Usage: genmove {w,b}'),
             "play": (2, 'Usage: play {b,w} MOVE'),
             "legal_moves": (1, 'Usage: legal_moves {w,b}'),
-            "policy":(1, 'Usage: set playout policy {random, rule_based}')
+            "policy":(1, 'Usage: set playout policy {random, rule_based}'),
+            "batch_size":(1, 'Usage: batch_size INT')
         }
     
     def set_playout_policy(self, args):
@@ -78,6 +80,13 @@ class GtpConnection():
         self.go_engine.set_playout_policy(playout_policy)
         self.respond()
 
+    def set_batch_size(self, args):
+        if not args[0].isdigit() or int(args[0]) < 1:
+            self.error(self.argmap["batch_size"][1])
+            return
+        self.go_engine.set_batch_size(int(args[0]))
+        self.respond()
+
     def display_pattern_moves(self, args):
         game_end, winner = self.board.check_game_end_gomoku()
         color=self.board.current_player
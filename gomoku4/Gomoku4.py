@@ -4,16 +4,24 @@
 
 from gtp_connection import GtpConnection
 from board_util import GoBoardUtil, EMPTY
-from simple_board import SimpleGoBoard
+from gomoku_board import GomokuBoard
 from MCTS import MCTS
+from parallel_mcts import RootParallelMCTS, TreeParallelMCTS, tree_capacity
+from transposition_mcts import TranspositionMCTS
 
 
 import random
+import sys
+import threading
 import numpy as np
 
+"""
+Default of set_memory_limit for a limit that stays as it is
+"""
+KEEP = object()
+
 def undo(board,move):
-    board.board[move]=EMPTY
-    board.current_player=GoBoardUtil.opponent(board.current_player)
+    board.undo_move_gomoku(move)
 
 def play_move(board, move, color):
     board.play_move_gomoku(move, color)
@@ -29,12 +37,12 @@ def game_result(board):
         return 'draw'
     return None
 
-def count_at_depth(node, depth, nodesAtDepth):
-    if not node._expanded:
+def count_at_depth(store, node, depth, nodesAtDepth):
+    if not store.is_expanded(node):
         return
     nodesAtDepth[depth] += 1
-    for _,child in node._children.items():
-        count_at_depth(child, depth+1, nodesAtDepth)
+    for child in store.children(node):
+        count_at_depth(store, child, depth+1, nodesAtDepth)
 
 
 class GomokuSimulationPlayer(object):
@@ -43,7 +51,7 @@ class GomokuSimulationPlayer(object):
     then select the one with best win-rate.
     playout could be either random or rule_based (i.e., uses pre-defined patterns) 
     """
-    def __init__(self, n_simualtions_per_move=500, playout_policy='random', board_size=7,limit=100, exploration=1.96):
+    def __init__(self, n_simualtions_per_move=None, playout_policy='random', board_size=7,limit=100, exploration=1.96):
         assert(playout_policy in ['random', 'rule_based'])
         self.n_simualtions_per_move=n_simualtions_per_move
         self.board_size=board_size
@@ -57,13 +65,174 @@ class GomokuSimulationPlayer(object):
         self.version = 4.0
         self.best_move=None
 
+        self.parallel = 'off'
+        self.num_workers = 1
+        self.leaf_rollouts = 1
+        self.widening = False
+        self.rave = False
+        self.priors = False
+        self.max_nodes = None
+        self.max_bytes = None
+        self.transpositions = False
+        self.ponder = False
+        self._ponder_thread = None
         self.MCTS = MCTS()
         self.limit = limit
         self.num_simulation = n_simualtions_per_move
         self.exploration = exploration
-        self.parent = None
         self.move = None
     
+    def set_parallel(self, mode, num_workers):
+        """
+        Select the search: 'off' for a single MCTS, 'root' for root-parallel
+        and 'tree' for tree-parallel MCTS with num_workers worker processes.
+        The worker processes are created here and reused for every move.
+        """
+        assert(mode in ['off', 'root', 'tree'])
+        assert(num_workers >= 1)
+        if mode == 'off':
+            num_workers = 1
+        else:
+            self.transpositions = False
+        if self.parallel != 'off':
+            self.MCTS.close()
+        self.parallel = mode
+        self.num_workers = num_workers
+        if mode == 'root':
+            self.MCTS = RootParallelMCTS(num_workers)
+        elif mode == 'tree':
+            self.MCTS = TreeParallelMCTS(num_workers, tree_capacity(self.max_nodes, self.max_bytes))
+        else:
+            self.MCTS = self._new_mcts()
+        self.MCTS.leaf_rollouts = self.leaf_rollouts
+        self.MCTS.max_nodes = self.max_nodes
+        self.MCTS.max_bytes = self.max_bytes
+
+    def set_transpositions(self, transpositions):
+        """
+        Use TranspositionMCTS, which shares the statistics of a position
+        between all the move orders that reach it, instead of the tree search.
+        It runs in this process only, so this turns parallel search off.
+        """
+        self.transpositions = transpositions
+        self.set_parallel('off', 1)
+
+    def set_ponder(self, ponder):
+        """
+        Search in a background thread while waiting for commands;
+        see start_pondering
+        """
+        self.stop_pondering()
+        self.ponder = ponder
+
+    def start_pondering(self, board):
+        """
+        Start running playouts from board in a background thread, if pondering
+        is on, the game is not over, and the search runs in this process.
+        The playouts stay in the tree for the next search.
+        """
+        if not self.ponder or self.parallel != 'off' or self._ponder_thread is not None:
+            return
+        if board.get_winner() is not None or len(board.get_empty_points()) == 0:
+            return
+        self._ponder_stop = threading.Event()
+        self._ponder_playouts = 0
+        self._ponder_thread = threading.Thread(target=self._ponder,
+                args=(board.copy(), self._ponder_stop))
+        self._ponder_thread.daemon = True
+        self._ponder_thread.start()
+
+    def _ponder(self, board, stop):
+        self._ponder_playouts = self.MCTS.ponder(board, self.exploration, stop)
+
+    def stop_pondering(self):
+        """
+        Stop the background search, waiting at most for the playout in progress.
+        Returns the number of playouts it ran.
+        """
+        if self._ponder_thread is None:
+            return 0
+        self._ponder_stop.set()
+        self._ponder_thread.join()
+        self._ponder_thread = None
+        if self._ponder_playouts:
+            sys.stderr.write("{} ponder playouts \n".format(self._ponder_playouts))
+            sys.stderr.flush()
+        return self._ponder_playouts
+
+    def _new_mcts(self):
+        if self.transpositions:
+            mcts = TranspositionMCTS()
+        else:
+            mcts = MCTS()
+        mcts.leaf_rollouts = self.leaf_rollouts
+        mcts.widening = self.widening
+        mcts.rave = self.rave
+        mcts.priors = self.priors
+        mcts.max_nodes = self.max_nodes
+        mcts.max_bytes = self.max_bytes
+        return mcts
+
+    def set_leaf_rollouts(self, leaf_rollouts):
+        """
+        Run leaf_rollouts rollouts as one batch from every leaf of the search.
+        1 is a single, sequential rollout.
+        """
+        assert(leaf_rollouts >= 1)
+        self.leaf_rollouts = leaf_rollouts
+        self.MCTS.leaf_rollouts = leaf_rollouts
+
+    def set_widening(self, widening):
+        """
+        Expand with the empty points near the stones only, and admit them
+        progressively as the visits of a node grow. Used by the single
+        process tree search; the parallel and transposition searches
+        always expand with every empty point.
+        """
+        self.widening = widening
+        self.MCTS.widening = widening
+
+    def set_rave(self, rave):
+        """
+        Blend all-moves-as-first statistics of the playouts into the UCT
+        values (RAVE). Used by the single process tree search only.
+        """
+        self.rave = rave
+        self.MCTS.rave = rave
+
+    def set_priors(self, priors):
+        """
+        Give new tree nodes for pattern moves (Win, BlockWin, OpenFour,
+        BlockOpenFour) prior visits and wins. Used by the single process
+        tree search only.
+        """
+        self.priors = priors
+        self.MCTS.priors = priors
+
+    def set_memory_limit(self, max_nodes=KEEP, max_bytes=KEEP):
+        """
+        Prune the search tree when it has more than max_nodes nodes or its
+        nodes take more than max_bytes bytes; None for no limit, and a limit
+        that is not given keeps its current value. With root
+        parallel search the limit is per worker. The tree-parallel search
+        has a fixed size instead, which is set from the limit, so its tree is
+        started again; the transposition table has a fixed size of its own.
+        """
+        if max_nodes is not KEEP:
+            self.max_nodes = max_nodes
+        if max_bytes is not KEEP:
+            self.max_bytes = max_bytes
+        if self.parallel == 'tree':
+            self.set_parallel('tree', self.num_workers)
+        self.MCTS.max_nodes = self.max_nodes
+        self.MCTS.max_bytes = self.max_bytes
+
+    def memory_usage(self):
+        """
+        Number of nodes (or table positions) of the search and their bytes
+        """
+        return self.MCTS.memory_usage()
+
     def set_playout_policy(self, playout_policy='random'):
         assert(playout_policy in ['random', 'rule_based'])
         self.playout_policy=playout_policy
@@ -76,7 +245,7 @@ class GomokuSimulationPlayer(object):
             return "Random", self._random_moves(board, color_to_play)
         else:
             assert(self.playout_policy=='rule_based')
-            assert(isinstance(board, SimpleGoBoard))
+            assert(isinstance(board, GomokuBoard))
             ret=board.get_pattern_moves()
             if ret is None:
                 return "Random", self._random_moves(board, color_to_play)
@@ -137,31 +306,45 @@ class GomokuSimulationPlayer(object):
 
     
     def reset(self):
-        self.MCTS = MCTS()
+        """
+        Start a new game: a new search tree, and no time saved by early stops
+        """
+        if self.parallel != 'off':
+            self.MCTS.reset()
+        else:
+            self.MCTS = self._new_mcts()
 
-    def update(self, move):
-        self.parent = self.MCTS._root 
-        self.MCTS.update_with_move(move)
+    def update(self, move, board=None):
+        """
+        Tell the search that move was played, by either side.
+        board is the position after it, so the tree can check that it
+        still matches; see MCTS.update_with_move.
+        """
+        self.MCTS.update_with_move(move, board)
     
 
-    def get_move_mc(self, board, toPlay):
+    def get_move_mc(self, board, toPlay, timelimit=None):
+        """
+        Search with MCTS for timelimit seconds, or self.limit if not given,
+        and at most self.n_simualtions_per_move playouts if that is not None.
+        The move is not played; call update once it is.
+        """
         #two_d_board = GoBoardUtil.get_twoD_board(board)
         #one_d_board = two_d_board.reshape((1,49))
 
         #first check if there are pattern can apply
         #pattern_moves = board.get_pattern_moves()
-        move = self.MCTS.get_move(board, toPlay, limit=self.limit,
+        if timelimit is None:
+            timelimit = self.limit
+        move = self.MCTS.get_move(board, toPlay, limit=timelimit,
                 num_simulation = self.n_simualtions_per_move,
                 exploration = self.exploration)
-        
-
-        self.update(move)
         return move
 
     def get_node_depth(self, root):
         MAX_DEPTH = 100
         nodesAtDepth = [0] * MAX_DEPTH
-        count_at_depth(root, 0, nodesAtDepth)
+        count_at_depth(self.MCTS._store, root, 0, nodesAtDepth)
         prev_nodes = 1
         return nodesAtDepth
         
@@ -171,7 +354,7 @@ def run():
     """
     start the gtp connection and wait for commands.
     """
-    board = SimpleGoBoard(7)
+    board = GomokuBoard(7)
     con = GtpConnection(GomokuSimulationPlayer(), board)
     con.start_connection()
 
@@ -8,143 +8,378 @@ parameter
 This function is loosely based on https://github.com/Rochester-NRT/RocAlphaGo/blob/develop/AlphaGo/mcts.py
 """
 import os, sys
+import math
+import time
 import numpy as np
 import random
 from board_util import GoBoardUtil, BLACK, WHITE, PASS
 from gtp_connection import point_to_coord, format_point
-from simple_board import SimpleGoBoard
+from gomoku_board import GomokuBoard
+from node_store import NodeStore, NO_NODE, NOT_PROVEN, PROVEN_WIN, PROVEN_LOSS
 from play_for_node_eva import Play_for_evaluate
+from batch_playout import batch_rollout
 
 PASS = 'pass'
 
-def uct_val(node, child, exploration, max_flag): 
-    if child._n_visits == 0:
-        return float("inf")
-    if max_flag:
-        return float(child._black_wins)/child._n_visits + exploration*np.sqrt(np.log(node._n_visits)/child._n_visits)
-    else:
-        return float(child._n_visits - child._black_wins)/child._n_visits + exploration*np.sqrt(np.log(node._n_visits)/child._n_visits)
+"""
+Time management for get_move. The search stops at
+start + min(limit - TIME_MARGIN, limit * TIME_FRACTION), which leaves time
+to pick the move and answer over GTP. The clock is read every CHECK_EVERY playouts.
+Time left over by searches that stop early is saved, and a later search
+may use it for up to limit - TIME_MARGIN. A search only counts as stopped
+early if it leaves more than MIN_SAVING seconds, and more than the time
+of one CHECK_EVERY interval of playouts.
+"""
+TIME_MARGIN = 0.5
+TIME_FRACTION = 0.9
+CHECK_EVERY = 4
+MIN_SAVING = 0.05
+
+"""
+Progressive widening: with widening on, a node with n visits may have
+at most 1 + WIDENING_SCALE * n ** WIDENING_EXPONENT children.
+"""
+WIDENING_SCALE = 1.0
+WIDENING_EXPONENT = 0.5
+
+"""
+RAVE: the weight of the AMAF win rate of a move with n visits is
+beta = sqrt(RAVE_EQUIVALENCE / (3 * n + RAVE_EQUIVALENCE)),
+so both win rates count the same at n = RAVE_EQUIVALENCE visits.
+"""
+RAVE_EQUIVALENCE = 1000
 
-class TreeNode(object):
+"""
+Prior visits and win rate, for the player making the move, that a child
+starts with when its move is in a pattern class of board.get_pattern_moves:
+Win, BlockWin, OpenFour, BlockOpenFour. They count like playouts, so their
+weight in UCT fades as the child gets real visits (progressive bias).
+"""
+PATTERN_PRIORS = [(20, 1.0), (20, 0.9), (10, 0.9), (10, 0.7)]
+
+"""
+When the tree is over its memory budget, it is pruned to PRUNE_FRACTION
+of its nodes, so that it is not pruned again at every playout.
+"""
+PRUNE_FRACTION = 0.5
+
+def widening_limit(visits):
     """
-    A node in the MCTS tree.
+    Number of children a node with visits visits may have
     """
-    version = 1
-    name = "MCTS Player"
-    def __init__(self, parent):
-        """
-        parent is set when a node gets expanded
-        """
-        self._parent = parent
-        self._children = {}  # a map from move to TreeNode
-        self._n_visits = 0
-        self._black_wins = 0
-        self._expanded = False
-        self._move = None
-
-    def expand(self, board, color):
-        """
-        Expands tree by creating new children.
-        """
-        moves = board.get_empty_points()
-        for move in moves:
-            if move not in self._children:
-                if board.is_legal(move, color) and not board.is_eye(move, color):
-                    self._children[move] = TreeNode(self)    #create a new child at this move node
-                    self._children[move]._move = move
-        
-        self._children[PASS] = TreeNode(self)             #?? alos give pass move a child?
-        self._children[PASS]._move = PASS  #1
-        self._expanded = True
+    return 1 + int(WIDENING_SCALE * visits ** WIDENING_EXPONENT)
 
-    def select(self, exploration, max_flag):
-        """
-        Select move among children that gives maximizes UCT. 
-        If number of visits are zero for a node, value for that node is infinite, so definitely will get selected
+def search_deadline(start, limit, saved_time = 0.0):
+    """
+    Monotonic-clock time at which a search with time limit limit must stop,
+    using saved_time seconds saved by earlier searches if there is room.
+    No deadline if limit is None.
+    """
+    if limit is None:
+        return float("inf")
+    return start + max(0.0, min(limit - TIME_MARGIN, limit * TIME_FRACTION + saved_time))
 
-        It uses: argmax(child_num_black_wins/child_num_vists + C * sqrt(2 * ln * Parent_num_vists/child_num_visits) )
-        Returns:
-        A tuple of (move, next_node)
-        """
-        return max(self._children.items(), key=lambda items:uct_val(self, items[1], exploration, max_flag))
-        
-    def update(self, leaf_value):
-        """
-        Update node values from leaf evaluation.
-        Arguments:
-        leaf_value -- the value of subtree evaluation from the current player's perspective.
-        
-        Returns:
-        None
-        """
-        self._black_wins += leaf_value
-        self._n_visits += 1
+def hash_before_move(board, point):
+    """
+    board.get_hash() of the position before the last move, a stone on point
+    """
+    color = board.get_color(point)
+    zobrist_to_play = board.geometry.zobrist_to_play
+    return board.get_hash() ^ board.geometry.zobrist[color][point] ^ \
+           zobrist_to_play[board.current_player] ^ zobrist_to_play[color]
 
-    def update_recursive(self, leaf_value):
-        """
-        Like a call to update(), but applied recursively for all ancestors.
+def uct_val(store, node, child, exploration): 
+    n_visits = store.visits[child]
+    if n_visits == 0:
+        return float("inf")
+    return store.wins[child]/n_visits + exploration*np.sqrt(np.log(store.visits[node])/n_visits)
 
-        Note: it is important that this happens from the root downward so that 'parent' visit
-        counts are correct.
-        """
-        # If it is not root, this node's parent should be updated first.
-        if self._parent:
-            self._parent.update_recursive(leaf_value)
-        self.update(leaf_value)
+def select(store, node, exploration, max_children = None):
+    """
+    Select the child of node that maximizes UCT.
+    If number of visits are zero for a node, value for that node is infinite, so definitely will get selected
 
+    It uses: argmax(child_num_wins/child_num_vists + C * sqrt(2 * ln * Parent_num_vists/child_num_visits) )
+    The wins of a child are those of the player to move at node, so they
+    are used as stored for either color.
+    A candidate move without a child is unvisited, so while node has one, the child
+    for the next of them is created and selected, unless node already has
+    max_children children. Otherwise UCT is computed for all the children
+    in one NumPy expression. Ties go to the first child, as with max().
+    Children proven lost for the player to move are never selected while there
+    is another child, or a candidate move to create one for.
+    Returns:
+    The id of the selected child
+    """
+    if store.can_add_child(node) and \
+       (max_children is None or store.num_children[node] < max_children):
+        return store.add_child(node)
+    children = store.children(node)
+    visits = store.visits[children]
+    wins = store.wins[children]
+    parent_visits = store.visits[node]
+    log_parent = math.log(parent_visits) if parent_visits > 0 else 0.0
+    safe_visits = np.maximum(visits, 1.0)
+    uct = wins / safe_visits + exploration * np.sqrt(log_parent / safe_visits)
+    uct[visits == 0] = np.inf
+    lost = store.proven[children] == PROVEN_LOSS
+    if lost.any():
+        if lost.all() and store.can_add_child(node):
+            return store.add_child(node)
+        uct[lost] = -np.inf
+    return int(children[uct.argmax()])
 
-    def is_leaf(self):
-        """
-        Check if leaf node (i.e. no nodes below this have been expanded).
-        """
-        return self._children == {}
+def select_rave(store, node, exploration, max_children = None):
+    """
+    Select the child of node, or the candidate move to create a child for,
+    that maximizes UCT on the blend (1 - beta) * win rate + beta * AMAF win rate.
+    A candidate without a child has no visits, so its beta is 1; only moves
+    without any statistics get the infinite value of unvisited children.
+    With max_children, candidates beyond the existing children are only
+    considered while node has fewer children, or all of them are proven lost.
+    Returns:
+    The id of the selected child
+    """
+    first = int(store.first_child[node])
+    num_children = int(store.num_children[node])
+    children = store.child_ids[first:first + num_children]
+    lost = store.proven[children] == PROVEN_LOSS
+    num = int(store.num_candidates[node])
+    if max_children is not None and num_children >= max_children and not lost.all():
+        num = num_children
+    visits = np.zeros(num)
+    wins = np.zeros(num)
+    visits[:num_children] = store.visits[children]
+    wins[:num_children] = store.wins[children]
+    amaf_visits = store.amaf_visits[first:first + num].astype(np.float64)
+    amaf_wins = store.amaf_wins[first:first + num].astype(np.float64)
+    beta = np.sqrt(RAVE_EQUIVALENCE / (3 * visits + RAVE_EQUIVALENCE))
+    value = (1 - beta) * wins / np.maximum(visits, 1.0) + \
+            beta * amaf_wins / np.maximum(amaf_visits, 1.0)
+    parent_visits = store.visits[node]
+    log_parent = math.log(parent_visits) if parent_visits > 0 else 0.0
+    value += exploration * np.sqrt(log_parent / np.maximum(visits, 1.0))
+    value[(visits == 0) & (amaf_visits == 0)] = np.inf
+    value[:num_children][lost] = -np.inf
+    i = int(value.argmax())
+    if i >= num_children:
+        return store.add_child(node, first + i)
+    return int(children[i])
 
-    def is_root(self):
-        return self._parent is None
+def best_child(store, node):
+    """
+    The child of node to play: one that is proven won for the player to
+    move if there is one, else the most visited child that is not proven
+    lost, or the most visited of all if they all are. NO_NODE if node has no child.
+    """
+    children = store.children(node)
+    if len(children) == 0:
+        return NO_NODE
+    proven = store.proven[children]
+    visits = store.visits[children].copy()
+    visits[proven == PROVEN_WIN] = np.inf
+    if not (proven == PROVEN_LOSS).all():
+        visits[proven == PROVEN_LOSS] = -1
+    return int(children[visits.argmax()])
 
 
 class MCTS(object):
+    """
+    The search tree is kept in a NodeStore; nodes are integer ids into it.
+    """
     def __init__(self):
-        self._root = TreeNode(None)
+        self._store = NodeStore()
+        self._root = self._store.new_node()
         self.toplay = BLACK
+        # board.get_hash() of the root position, None if not known
+        self._root_hash = None
+        # write search statistics to stderr after every get_move
+        self.verbose = True
+        # UCT exploration constant, set again by every get_move and ponder
+        self.exploration = 1.96
+        # rollouts run as one batch from every leaf (leaf parallelism)
+        self.leaf_rollouts = 1
+        # expand with the points near the stones only, and widen progressively
+        self.widening = False
+        # blend all-moves-as-first statistics into selection
+        self.rave = False
+        # start children of pattern moves with prior statistics
+        self.priors = False
+        # memory budget of the tree, None for no limit; see _prune
+        self.max_nodes = None
+        self.max_bytes = None
+        self.num_prunes = 0
+        # set when pruning cannot meet the budget, until the next search
+        self._budget_too_small = False
+        # stop the search once the move to play cannot change
+        self.early_stop = True
+        # seconds saved by searches that stopped before their deadline
+        self.saved_time = 0.0
+
+    def _expand(self, node, board):
+        """
+        Expands node with every empty point as a candidate move, or with
+        widening on, with the points near the stones in the order of
+        board.get_candidate_points; children are only created when select picks them.
+        With priors on, the moves of the pattern class of board.get_pattern_moves
+        come first and get the PATTERN_PRIORS of their class.
+        Every empty point is a legal Gomoku move, and Gomoku has no pass.
+        """
+        if self.widening:
+            moves = board.get_candidate_points()
+        else:
+            moves = board.get_empty_points()
+        pattern_moves = []
+        if self.priors:
+            pattern, pattern_moves = board.get_pattern_moves()
+            if pattern_moves:
+                in_pattern = set(pattern_moves)
+                moves = pattern_moves + [move for move in moves if move not in in_pattern]
+        store = self._store
+        first = store.add_candidates(node, moves)
+        if pattern_moves:
+            prior_visits, win_rate = PATTERN_PRIORS[pattern]
+            end = first + len(pattern_moves)
+            store.prior_visits[first:end] = prior_visits
+            store.prior_wins[first:end] = prior_visits * win_rate
+
     def _playout(self, board, color):
         """
         Run a single playout from the root to the given depth, getting a value at the leaf and
-        propagating it back through its parents. State is modified in-place, so a copy must be
-        provided.
+        propagating it back along the path of selected nodes. The moves are played on board and taken
+        back with undo_to before returning, so the same board serves every playout.
+        A move that makes five proves its node won; the descent stops at proven
+        nodes, which take their value from the proof instead of a rollout, and
+        proofs are propagated to the ancestors (MCTS-Solver).
 
         Arguments:
-        board -- a copy of the board.
+        board -- the board at the root position.
         color -- color to play
         
 
         Returns:
         None
         """
+        store = self._store
+        root_moves = len(board.moves)
+        root_color = color
         node = self._root 
-        # This will be True olny once for the root
-        if not node._expanded:
-            node.expand(board, color)
-        while not node.is_leaf():
+        path = [node]
+        # A node is expanded when a playout first passes through it: the root on
+        # the first playout, any other node once a rollout has been run from it.
+        # The descent stops at the node it creates, even if that starts with
+        # prior visits, so that every node gets a rollout of its own.
+        while store.proven[node] == NOT_PROVEN:
+            if not store.is_expanded(node):
+                self._expand(node, board)
+            if store.is_leaf(node):
+                break
             # Greedily select next move.                
-            max_flag = color == BLACK                  #why max flag is a color?
-            move, next_node = node.select(self.exploration,max_flag)
-            if move!=PASS:
-                assert board.is_legal_gomoku(move, color)
-            if move == PASS:
-                move = None
-            board.play_move(move, color)
+            created = store.num_nodes
+            max_children = widening_limit(store.visits[node]) if self.widening else None
+            if self.rave:
+                node = select_rave(store, node, self.exploration, max_children)
+            else:
+                node = select(store, node, self.exploration, max_children)
+            path.append(node)
+            move = int(store.move[node])
+            assert board.is_legal_gomoku(move, color)
+            board.play_move_gomoku(move, color)
             color = GoBoardUtil.opponent(color) 
-            node = next_node
-        assert node.is_leaf()
-        if not node._expanded:
-            node.expand(board, color)
+            if board.get_winner() is not None:
+                store.proven[node] = PROVEN_WIN
+            if node >= created:
+                break
 
         assert board.current_player == color
         #board.current_player = color
-        leaf_value = self._evaluate_rollout(board, color)  
-        # Update value and visit count of nodes in this traversal.
-        node.update_recursive(leaf_value)
+        if store.proven[node] != NOT_PROVEN:
+            # color is to play at node, the other player made the move into it
+            black_won = (store.proven[node] == PROVEN_WIN) == (color != BLACK)
+            leaf_value = self.leaf_rollouts if black_won else 0
+        elif self.leaf_rollouts > 1:
+            leaf_value = self._evaluate_batch(board, self.leaf_rollouts)
+        else:
+            leaf_value = self._evaluate_rollout(board, color)  
+        # Update value and visit count of nodes in this traversal,
+        # starting with the wins of the player who moved into the leaf.
+        if color == BLACK:
+            wins = self.leaf_rollouts - leaf_value
+        else:
+            wins = leaf_value
+        store.update_path(path, self.leaf_rollouts, wins)
+        if store.proven[node] != NOT_PROVEN:
+            store.propagate_proof(node, len(board.get_empty_points()))
+        if self.rave:
+            self._update_amaf(board, path, root_moves, root_color, leaf_value)
+        board.undo_to(root_moves)
+        if not self._budget_too_small and self._over_budget():
+            self._prune()
+
+    def _over_budget(self):
+        store = self._store
+        return (self.max_nodes is not None and store.num_nodes > self.max_nodes) or \
+               (self.max_bytes is not None and store.bytes_in_use() > self.max_bytes)
+
+    def _prune(self):
+        """
+        Shrink the tree to about PRUNE_FRACTION of its nodes: the least visited
+        nodes become leaves again and their subtrees are dropped. The tree is
+        copied into a new, compact store, so the memory of the old one is freed.
+        The nodes that are kept, the root and its children included, keep
+        their statistics and proofs. If the pruned tree is still over the
+        budget, which is smaller than the root and its children then, pruning
+        stops until the next search instead of copying the tree every playout.
+        """
+        store = self._store
+        n = store.num_nodes
+        parents = store.parent[:n]
+        # a node is kept if its parent has more visits than the threshold
+        parent_visits = np.sort(store.visits[parents[parents != NO_NODE]])[::-1]
+        target = int(n * PRUNE_FRACTION)
+        if target >= len(parent_visits):
+            return
+        self._store = store.subtree(self._root, leaf_visits = parent_visits[target])
+        self._root = 0
+        self.num_prunes += 1
+        if self._over_budget():
+            self._budget_too_small = True
+
+    def memory_usage(self):
+        """
+        Number of nodes of the tree and the bytes they take
+        """
+        return self._store.num_nodes, self._store.bytes_in_use()
+
+    def _update_amaf(self, board, path, root_moves, root_color, leaf_value):
+        """
+        Add the playout result, leaf_value black wins, to the AMAF statistics
+        of every candidate move of a node on path that the player to move at
+        that node played later in the playout.
+        root_color is the color to move at the root.
+        The moves of the playout are the ones on board after
+        root_moves: the moves in the tree and, for a single rollout, the
+        moves of the rollout, which Play_for_evaluate.rollout leaves on board.
+        A batch of leaf rollouts does not play on board, so then only the
+        moves in the tree count.
+        """
+        store = self._store
+        if root_color == BLACK:
+            wins = [leaf_value, self.leaf_rollouts - leaf_value]
+        else:
+            wins = [self.leaf_rollouts - leaf_value, leaf_value]
+        ply = np.full(board.maxpoint, -1, dtype = np.intp)
+        moves = [point for point, _ in board.moves[root_moves:]]
+        ply[moves] = np.arange(len(moves))
+        for depth, node in enumerate(path):
+            first = int(store.first_child[node])
+            num = int(store.num_candidates[node])
+            if num == 0:
+                continue
+            played = ply[store.candidate_moves[first:first + num]]
+            slots = first + np.nonzero((played >= depth) & ((played - depth) % 2 == 0))[0]
+            store.amaf_visits[slots] += self.leaf_rollouts
+            store.amaf_wins[slots] += wins[depth % 2]
 
     def _evaluate_rollout(self, board, toPlay):
         """
@@ -163,6 +398,14 @@ class MCTS(object):
             return 0
 
 
+    def _evaluate_batch(self, board, num_rollouts):
+        """
+        Run num_rollouts random games from board as one NumPy batch.
+        Returns the number of them that black wins.
+        """
+        winners, _ = batch_rollout(board, num_rollouts)
+        return int(np.count_nonzero(winners == BLACK))
+
     def get_move(self,
             board,
             toplay,
@@ -170,48 +413,191 @@ class MCTS(object):
             num_simulation,
             exploration):
         """
-        Runs all playouts sequentially and returns the most visited move.
+        Runs playouts sequentially until the deadline derived from limit (seconds)
+        or until num_simulation playouts are done, whichever comes first.
+        Either of them may be None for no bound. At least one playout is run.
+        The search also stops as soon as the root is proven.
+        Each playout runs self.leaf_rollouts rollouts from its leaf.
+        Returns a move proven to win if there is one, else the most visited
+        move that is not proven to lose.
+        With early_stop, the search also stops when that move can no longer
+        change, and the time it did not use is added to saved_time, unless
+        that is within _saving_margin.
         """
-        if self.toplay != toplay:
-            sys.stderr.write("Dumping the subtree! \n")
-            sys.stderr.flush()
-            self._root = TreeNode(None)
+        reused = self._set_root(board, toplay)
         
         self.limit = limit
         
-        self.toplay = toplay
         self.exploration = exploration
         
-        for n in range(num_simulation):
-            board_copy = board.copy()
+        start = time.monotonic()
+        budget = search_deadline(start, limit) - start
+        deadline = search_deadline(start, limit, self.saved_time)
+        # one copy for the whole search, playouts undo their moves
+        board_copy = board.copy()
+        prunes = self.num_prunes
+        stopped_early = False
+        n = 0
+        while num_simulation is None or n < num_simulation:
             self._playout(board_copy, toplay)
-        # choose a move that has the most visit 
-        moves_ls =  [(move, node._n_visits) for move, node in self._root._children.items()]
-        
-        if not moves_ls:
+            n += 1
+            if self._root_proven():
+                break
+            if n % CHECK_EVERY == 0:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                if self.early_stop:
+                    remaining = float("inf")
+                    if num_simulation is not None:
+                        remaining = num_simulation - n
+                    if deadline != float("inf"):
+                        remaining = min(remaining, (deadline - now) * n / (now - start))
+                    if self._decided(remaining):
+                        # near the deadline the estimate of remaining falls
+                        # toward 0, that is not an early stop
+                        stopped_early = deadline - now > self._saving_margin(now - start, n)
+                        break
+        elapsed = time.monotonic() - start
+        if limit is not None:
+            saving = budget - elapsed
+            if 0 < saving <= self._saving_margin(elapsed, n):
+                # the search ran out the clock
+                saving = 0.0
+            self.saved_time = max(0.0, self.saved_time + saving)
+        if self.verbose:
+            sys.stderr.write("{} playouts in {:.2f}s, {:.0f} root visits reused{} \n"
+                             .format(n, elapsed, reused,
+                                     self._proof_message(self._root)))
+            if stopped_early:
+                sys.stderr.write("Stopped early, {:.2f}s before the deadline, {:.2f}s saved in all \n"
+                                 .format(max(0.0, deadline - start - elapsed), self.saved_time))
+            if self.num_prunes > prunes:
+                sys.stderr.write("Pruned the tree {} times, {} nodes left \n"
+                                 .format(self.num_prunes - prunes, self._store.num_nodes))
+            if self._budget_too_small:
+                sys.stderr.write("Memory budget too small for the root and its children, "
+                                 "pruning stopped for this search \n")
+            sys.stderr.flush()
+        best = best_child(self._store, self._root)
+        if best == NO_NODE:
             return None
-        #error checking
-        moves_ls = sorted(moves_ls,key=lambda i:i[1],reverse=True)
-        
-        move = moves_ls[0]
-        self.print_stat(board, self._root, toplay)
+        move = int(self._store.move[best])
+        if self.verbose:
+            self.print_stat(board, self._root, toplay)
         #self.good_print(board,self._root,self.toplay,10)
-        if move[0] == PASS:
-            return None
-        assert board.is_legal(move[0], toplay)
-        return move[0]
+        assert board.is_legal_gomoku(move, toplay)
+        return move
         
-    def update_with_move(self, last_move):
+    def _saving_margin(self, elapsed, n):
+        """
+        Seconds a search that ran n playouts in elapsed seconds must leave
+        to have stopped early: MIN_SAVING, or one CHECK_EVERY interval
+        of playouts if that takes longer
+        """
+        return max(MIN_SAVING, CHECK_EVERY * elapsed / n)
+
+    def _decided(self, remaining):
+        """
+        Check if the move get_move would play cannot change in remaining
+        more playouts: the most visited root child that is not proven lost
+        leads every other move by more visits than they can add.
+        """
+        store = self._store
+        children = store.children(self._root)
+        visits = store.visits[children][store.proven[children] != PROVEN_LOSS]
+        if store.can_add_child(self._root):
+            # a candidate move without a child starts with its prior visits
+            i = int(store.first_child[self._root])
+            pending = store.prior_visits[i + store.num_children[self._root]:
+                                         i + store.num_candidates[self._root]]
+            visits = np.append(visits, pending.max())
+        if len(visits) < 2:
+            return len(visits) == 1 and not store.can_add_child(self._root)
+        second, first = np.partition(visits, len(visits) - 2)[-2:]
+        return first - second > remaining * self.leaf_rollouts
+
+    def _set_root(self, board, toplay):
+        """
+        Make board, with toplay to play, the root position, keeping the tree
+        if it was already searched from there. Returns the visits of the root.
+        """
+        if self.toplay != toplay or self._root_hash not in (None, board.get_hash()):
+            sys.stderr.write("Dumping the subtree! \n")
+            sys.stderr.flush()
+            self._store.clear()
+            self._root = self._store.new_node()
+        self._root_hash = board.get_hash()
+        self.toplay = toplay
+        # a new search may prune again
+        self._budget_too_small = False
+        return self._store.visits[self._root]
+
+    def ponder(self, board, exploration, stop):
+        """
+        Run playouts from board, for the player to move, until the
+        threading.Event stop is set or the root is proven. Meant for a background thread while
+        the opponent thinks; the playouts stay in the tree for the next search.
+        Returns the number of playouts.
+        """
+        self._set_root(board, board.current_player)
+        self.exploration = exploration
+        board_copy = board.copy()
+        n = 0
+        while not stop.is_set() and not self._root_proven():
+            self._playout(board_copy, board_copy.current_player)
+            n += 1
+        return n
+
+    def _root_proven(self):
+        """
+        Check if the solver has proven the root, so searching it is done
+        """
+        return self._store.proven[self._root] != NOT_PROVEN
+
+    def _proof_message(self, node):
+        """
+        ", proven win" or ", proven loss" for the player to move at node, or ""
+        """
+        proven = self._store.proven[node]
+        if proven == PROVEN_LOSS:
+            return ", proven win"
+        if proven == PROVEN_WIN:
+            return ", proven loss"
+        return ""
+
+    def root_statistics(self):
+        """
+        Moves, visits, wins and proofs of the children of the root, as arrays.
+        The wins and proofs are those of the player to move at the root.
+        """
+        children = self._store.children(self._root)
+        store = self._store
+        return store.move[children], store.visits[children], store.wins[children], \
+               store.proven[children]
+
+    def update_with_move(self, last_move, board = None):
         """
         Step forward in the tree, keeping everything we already know about the subtree, assuming
-        that get_move() has been called already. Siblings of the new root will be garbage-collected.
+        that get_move() has been called already. The subtree is copied into a new store
+        and the rest of the tree is dropped.
+        board is the position after last_move, if known. Then the subtree is only kept
+        if the root is the position before last_move, and the new root is marked as board.
         """
-        if last_move in self._root._children:
-            self._root = self._root._children[last_move]
+        child = NO_NODE
+        if board is None or self._root_hash == hash_before_move(board, last_move):
+            child = self._store.find_child(self._root, last_move)
+        if child != NO_NODE:
+            self._store = self._store.subtree(child)
         else:
-            self._root = TreeNode(None)
-        self._root._parent = None
-        self.toplay = GoBoardUtil.opponent(self.toplay)
+            self._store = NodeStore()
+        self._root = 0 if self._store.num_nodes else self._store.new_node()
+        if board is None:
+            self._root_hash = None
+            self.toplay = GoBoardUtil.opponent(self.toplay)
+        else:
+            self._root_hash = board.get_hash()
+            self.toplay = board.current_player
 
     def point_to_string(self, board_size, point):
         if point == None:
@@ -228,82 +614,71 @@ class MCTS(object):
             raise ValueError("Provided integer value for color is invalid")
 
     def good_print(self, board, node, color, num_nodes):
+        store = self._store
         cboard = board.copy()
         sys.stderr.write("\nTaking a tour of selection policy in tree! \n\n")
-        sys.stderr.write(str(cboard.get_twoD_board()))
+        sys.stderr.write(str(GoBoardUtil.get_twoD_board(cboard)))
         sys.stderr.flush()
-        while not node.is_leaf():
-            if node._move != None:
-                if node._move != PASS:
-                    pointString = self.point_to_string(board.size, node._move)
-                else:
-                    pointString = node._move
+        while not store.is_leaf(node):
+            if node != self._root:
+                pointString = self.point_to_string(board.size, int(store.move[node]))
             else: 
                 pointString = 'Root'
             sys.stderr.write("\nMove: {} Numebr of children {}, Number of visits: {}\n"
-                .format(pointString,len(node._children),node._n_visits))
+                .format(pointString,store.num_children[node],store.visits[node]))
             sys.stderr.flush()
             moves_ls = []
-            max_flag = color == BLACK
-            for move,child in node._children.items():
-                uctval = uct_val(node,child,self.exploration,max_flag)
-                moves_ls.append((move,uctval,child))
+            for child in store.children(node):
+                uctval = uct_val(store,node,child,self.exploration)
+                moves_ls.append((int(store.move[child]),uctval,child))
             moves_ls = sorted(moves_ls,key=lambda i:i[1],reverse=True)
 
             if moves_ls:
                 sys.stderr.write("\nPrinting {} of {} childs that have highest UCT value \n\n".format(num_nodes, pointString))
                 sys.stderr.flush()
-                for i in range(num_nodes):
-                    move = moves_ls[i][0]
-                    child_val = moves_ls[i][1]
-                    child_node = moves_ls[i][2]
-                    if move !=PASS:
-                        sys.stderr.write("\nChild point:{} ;UCT Value {}; Number of visits: {}; Number of Black wins: {}\n"
-                            .format(self.point_to_string(cboard.size, move), child_val, child_node._n_visits, child_node._black_wins))
-                        sys.stderr.flush()
-                    else:
-                        sys.stderr.write("\nChild point:{} ;UCT Value {}; Number of visits: {}; Number of Black wins: {} \n"
-                            .format(move, child_val, child_node._n_visits, child_node._black_wins))
-                        sys.stderr.flush()
+                for move, child_val, child in moves_ls[:num_nodes]:
+                    sys.stderr.write("\nChild point:{} ;UCT Value {}; Number of visits: {}; Number of wins: {}\n"
+                        .format(self.point_to_string(cboard.size, move), child_val, store.visits[child], store.wins[child]))
+                    sys.stderr.flush()
             # Greedily select next move.                
-            max_flag = color == BLACK
-            move, next_node = node.select(self.exploration,max_flag)
-            if move==PASS:
-                move = None
-            assert cboard.is_legal(move, color)
+            node = select(store, node, self.exploration)
+            move = int(store.move[node])
+            assert cboard.is_legal_gomoku(move, color)
             pointString = self.point_to_string(cboard.size, move)
-            cboard.play_move(move, color)
+            cboard.play_move_gomoku(move, color)
             sys.stderr.write("\nBoard in simulation after chosing child {} in tree. \n".format(pointString))
-            sys.stderr.write(str(cboard.get_twoD_board()))
+            sys.stderr.write(str(GoBoardUtil.get_twoD_board(cboard)))
             sys.stderr.flush()
             color = GoBoardUtil.opponent(color) 
-            node = next_node
-        assert node.is_leaf()
-        cboard.current_player = color
+        assert store.is_leaf(node)
         leaf_value = self._evaluate_rollout(cboard, color)  
         sys.stderr.write("\nWinner of simulation is: {} color, Black is 0 an \n".format(leaf_value))
         sys.stderr.flush()
 
     def print_stat(self, board, root, color):
+        store = self._store
         s_color = self.int_to_color(color)
-        sys.stderr.write("Numebr of children {} \n".format(len(root._children)))
+        sys.stderr.write("Numebr of children {} \n".format(store.num_children[root]))
         sys.stderr.flush()
-        sys.stderr.write("Number of roots visits: {} \n".format(root._n_visits))
+        sys.stderr.write("Number of roots visits: {} \n".format(store.visits[root]))
         sys.stderr.flush()
         stats=[]
-        for move,node in root._children.items():
-            if color == BLACK:
-                wins = node._black_wins
-            else:
-                wins = node._n_visits - node._black_wins
-            visits = node._n_visits
+        first = store.first_child[root]
+        for i, child in enumerate(store.children(root)):
+            wins = store.wins[child]
+            visits = store.visits[child]
             if visits:
-                win_rate = round(float(wins)/visits,2)    
+                win_rate = round(float(wins)/float(visits),2)    
             else:
                 win_rate = 0
-            if move==PASS:
-                move = None
-            pointString = self.point_to_string(board.size, move)
-            stats.append((pointString,win_rate,wins,visits))
+            pointString = self.point_to_string(board.size, int(store.move[child]))
+            if self.rave:
+                # AMAF win rate as a fifth entry
+                amaf_visits = store.amaf_visits[first + i]
+                amaf_wins = store.amaf_wins[first + i]
+                amaf_rate = round(float(amaf_wins)/float(amaf_visits),2) if amaf_visits else 0
+                stats.append((pointString,win_rate,int(wins),int(visits),amaf_rate))
+            else:
+                stats.append((pointString,win_rate,int(wins),int(visits)))
         sys.stderr.write("Statistics: {} \n".format(sorted(stats,key=lambda i:i[3],reverse=True)))
         sys.stderr.flush()
@@ -0,0 +1,115 @@
+"""
+batch_playout.py
+
+Random playouts of many games at once with NumPy.
+
+The games of a batch are the rows of a 2-D array, one padded 1-d board
+per row in the encoding of coord_to_point, and they may all be different.
+
+A uniformly random playout plays the empty points in a uniformly random
+order, alternating colors. So every game gets a random permutation that says
+at which ply each of its empty points is played: one vectorized draw picks
+the moves of all games for all plies. From it follow the color of each point
+at the end of the game and the ply at which each five-point window is
+completed, by gathering the windows out of the board rows. The first
+single-color window to be completed decides the winner, and the game ends
+there, as it would with play_move_gomoku; the rest of its moves are ignored.
+"""
+
+import numpy as np
+from board_util import BLACK, WHITE, EMPTY
+
+"""
+Completion ply of a window that is never filled by a single color
+"""
+NO_FIVE = np.iinfo(np.int32).max
+
+_windows = {}
+
+def five_windows(size):
+    """
+    Read-only array with one row for every five points in a row
+    on a board of given size, computed once per size
+    """
+    windows = _windows.get(size)
+    if windows is None:
+        NS = size + 1
+        rows = []
+        for row in range(1, size + 1):
+            for col in range(1, size + 1):
+                for drow, dcol in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+                    if 1 <= row + 4 * drow <= size and 1 <= col + 4 * dcol <= size:
+                        point = row * NS + col
+                        rows.append([point + i * (drow * NS + dcol) for i in range(5)])
+        windows = np.array(rows, dtype = np.intp).reshape(-1, 5)
+        windows.flags.writeable = False
+        _windows[size] = windows
+    return windows
+
+
+def batch_playout(boards, to_play, windows):
+    """
+    Play one random game from every row of boards, which is not changed.
+    boards  -- 2-d array of padded 1-d boards, one game per row
+    to_play -- color to play in each game, an array or a single color
+    windows -- five_windows() of the board size
+    Returns two arrays with one entry per game: the winner (BLACK, WHITE,
+    or EMPTY for a draw) and the number of plies played. A board that already
+    has a five is won by the color of one of its fives, in 0 plies.
+    """
+    boards = np.asarray(boards)
+    num_games, maxpoint = boards.shape
+    games = np.arange(num_games)
+    empty = boards == EMPTY
+    num_empty = np.count_nonzero(empty, axis = 1)
+
+    # ply_board[g, p]: ply of game g at which the empty point p is played,
+    # -1 for stones and BORDER
+    keys = np.random.random_sample(boards.shape)
+    keys[~empty] = 2.0
+    order = np.argsort(keys, axis = 1)
+    ply_board = np.empty(boards.shape, dtype = np.int32)
+    ply_board[games[:, None], order] = np.arange(maxpoint, dtype = np.int32)
+    ply_board[~empty] = -1
+
+    to_play = np.broadcast_to(np.asarray(to_play, dtype = np.int32), (num_games,))[:, None]
+    mover = np.where(ply_board % 2 == 0, to_play, BLACK + WHITE - to_play)
+    colors = np.where(empty, mover, boards)
+    return _first_five(colors, ply_board, num_empty, windows)
+
+
+def _first_five(colors, ply_board, num_empty, windows):
+    """
+    Winners and lengths of the games whose final boards are the rows
+    of colors, with the plies of their moves in ply_board
+    """
+    games = np.arange(len(colors))
+    window_colors = colors[:, windows]
+    five = (window_colors == window_colors[:, :, :1]).all(axis = 2) & \
+           ((window_colors[:, :, 0] == BLACK) | (window_colors[:, :, 0] == WHITE))
+    completed = np.where(five, ply_board[:, windows].max(axis = 2), NO_FIVE)
+    first = completed.argmin(axis = 1)
+    end_ply = completed[games, first]
+    won = end_ply != NO_FIVE
+    winners = np.where(won, window_colors[games, first, 0], EMPTY)
+    lengths = np.where(won, end_ply + 1, num_empty)
+    return winners.astype(np.int32), lengths.astype(np.int32)
+
+
+def batch_rollout(board, num_games):
+    """
+    Play num_games random games from board, which is not changed.
+    Returns the winners and lengths of the games, as batch_playout.
+    As all games start from the same position, only its empty points are shuffled.
+    """
+    row = np.asarray(board.board, dtype = np.int32)
+    empties = np.nonzero(row == EMPTY)[0]
+    # plies[g, i]: ply of game g at which empties[i] is played
+    plies = np.argsort(np.random.random_sample((num_games, len(empties))), axis = 1).astype(np.int32)
+    to_play = board.current_player
+    colors = np.tile(row, (num_games, 1))
+    colors[:, empties] = np.where(plies % 2 == 0, to_play, BLACK + WHITE - to_play)
+    ply_board = np.full(colors.shape, -1, dtype = np.int32)
+    ply_board[:, empties] = plies
+    num_empty = np.full(num_games, len(empties))
+    return _first_five(colors, ply_board, num_empty, five_windows(board.size))
@@ -0,0 +1,483 @@
+"""
+benchmark.py
+Timing harness for the Gomoku engine.
+
+Usage: python3 benchmark.py [name ...]
+With no name, every benchmark is run.
+"""
+
+import sys
+import time
+import random
+from simple_board import SimpleGoBoard
+from gomoku_board import GomokuBoard
+from board_util import GoBoardUtil, BLACK, WHITE, PASS, coord_to_point
+from MCTS import MCTS, select, uct_val, TIME_MARGIN
+from node_store import NO_NODE, NOT_PROVEN
+from parallel_mcts import TreeParallelMCTS
+from transposition_mcts import TranspositionMCTS
+from play_for_node_eva import Play_for_evaluate
+from batch_playout import batch_playout, five_windows
+import numpy as np
+
+
+def timed_rate(fn, seconds):
+    """
+    Call fn() repeatedly for about the given number of seconds.
+    Returns the number of calls per second.
+    """
+    count = 0
+    start = time.perf_counter()
+    end = start + seconds
+    now = start
+    while now < end:
+        fn()
+        count += 1
+        now = time.perf_counter()
+    return count / (now - start)
+
+
+def random_playout(board, game_end):
+    """
+    Play random moves until game_end(board) reports a finished game
+    or the board is full, then take all the moves back.
+    """
+    simulation_moves = []
+    while not game_end(board)[0]:
+        moves = board.get_empty_points()
+        if len(moves) == 0:
+            break
+        move = random.choice(moves)
+        board.play_move_gomoku(move, board.current_player)
+        simulation_moves.append(move)
+    for m in simulation_moves[::-1]:
+        board.undo_move_gomoku(m)
+
+
+def fill_playout(board):
+    """
+    Random moves until the board is full, one get_empty_points and
+    shuffle per ply: the rollout of playGame before it stopped at the first five.
+    """
+    while True:
+        move = GoBoardUtil.generate_random_move_gomoku(board)
+        if move == PASS:
+            break
+        board.play_move_gomoku(move, board.current_player)
+
+
+def bench_game_end(seconds=3.0):
+    """
+    Playouts per second with a full-board scan after every move,
+    against the O(1) incremental winner kept by play_move_gomoku.
+    """
+    board = SimpleGoBoard(7)
+    scan = timed_rate(lambda: random_playout(board, SimpleGoBoard.scan_game_end_gomoku), seconds)
+    incremental = timed_rate(lambda: random_playout(board, SimpleGoBoard.check_game_end_gomoku), seconds)
+    print("game_end: scan {:.1f} playouts/s, incremental {:.1f} playouts/s, speedup {:.2f}x"
+          .format(scan, incremental, incremental / scan))
+
+
+def bench_boards(seconds=3.0):
+    """
+    Random playouts per second for each board representation.
+    """
+    for board_class in [SimpleGoBoard, GomokuBoard]:
+        board = board_class(7)
+        rate = timed_rate(lambda: random_playout(board, board_class.check_game_end_gomoku), seconds)
+        print("boards: {} {:.1f} playouts/s".format(board_class.__name__, rate))
+
+
+def bench_copy(seconds=1.0):
+    """
+    board.copy() calls per second for each board representation.
+    """
+    for board_class in [SimpleGoBoard, GomokuBoard]:
+        board = board_class(7)
+        rate = timed_rate(board.copy, seconds)
+        print("copy: {} {:.0f} copies/s".format(board_class.__name__, rate))
+
+
+def bench_select(seconds=2.0, num_simulation=3000, exploration=1.96):
+    """
+    UCT selections per second over the expanded nodes of a searched tree,
+    one child at a time with uct_val against the vectorized select.
+    Only nodes with a child for every candidate move are sampled,
+    so that select does not create children.
+    """
+    mcts = MCTS()
+    mcts.early_stop = False
+    mcts.get_move(GomokuBoard(7), BLACK, None, num_simulation, exploration)
+    store = mcts._store
+    nodes = [node for node in range(store.num_nodes)
+             if 0 < store.num_children[node] == store.num_candidates[node]]
+    print("select: {} nodes, {} with every child created, {:.1f} children per expanded node"
+          .format(store.num_nodes, len(nodes),
+                  (store.num_nodes - 1.0) / np.count_nonzero(store.num_candidates[:store.num_nodes])))
+    busy = [node for node in nodes if store.visits[node] > store.num_children[node]]
+    for label, sample in [("all expanded nodes", nodes), ("nodes with every child visited", busy)]:
+        cycle = [0]
+        def scalar():
+            node = sample[cycle[0] % len(sample)]
+            cycle[0] += 1
+            max(store.children(node), key=lambda child: uct_val(store, node, child, exploration))
+        def vectorized():
+            node = sample[cycle[0] % len(sample)]
+            cycle[0] += 1
+            select(store, node, exploration)
+        scalar_rate = timed_rate(scalar, seconds)
+        vector_rate = timed_rate(vectorized, seconds)
+        print("select, {} ({}): uct_val {:.0f} selections/s, vectorized {:.0f} selections/s, speedup {:.2f}x"
+              .format(label, len(sample), scalar_rate, vector_rate, vector_rate / scalar_rate))
+
+
+def update_parents(store, node, leaf_value, visits=1):
+    """
+    Backpropagation by following the parent links from node to the root,
+    adding leaf_value to every node, as it was before NodeStore.update_path.
+    For comparison only: the values are not flipped per ply.
+    """
+    while node != NO_NODE:
+        store.visits[node] += visits
+        store.wins[node] += leaf_value
+        node = store.parent[node]
+
+
+def bench_backprop(seconds=2.0, num_simulation=3000, exploration=1.96):
+    """
+    Backpropagation time per playout on the paths of a searched tree,
+    with parent links against NodeStore.update_path on the recorded path.
+    Every node of the tree was the leaf of the playout that created it,
+    so the paths from the root to all nodes have the depths of real playouts.
+    """
+    for size, widening in [(7, False), (9, True)]:
+        mcts = MCTS()
+        mcts.verbose = False
+        mcts.early_stop = False
+        mcts.widening = widening
+        mcts.get_move(GomokuBoard(size), BLACK, None, num_simulation, exploration)
+        store = mcts._store
+        paths = []
+        for node in range(1, store.num_nodes):
+            path = [node]
+            while store.parent[path[-1]] != NO_NODE:
+                path.append(int(store.parent[path[-1]]))
+            paths.append(path[::-1])
+        depths = [len(path) - 1 for path in paths]
+        label = "{}x{}{}".format(size, size, ", widening" if widening else "")
+        print("backprop, {}: {} paths, depth mean {:.1f}, max {}"
+              .format(label, len(paths), np.mean(depths), max(depths)))
+        cycle = [0]
+        def parents():
+            path = paths[cycle[0] % len(paths)]
+            cycle[0] += 1
+            update_parents(store, path[-1], 1)
+        def recorded():
+            path = paths[cycle[0] % len(paths)]
+            cycle[0] += 1
+            store.update_path(path, 1, 1)
+        parents_rate = timed_rate(parents, seconds)
+        path_rate = timed_rate(recorded, seconds)
+        print("backprop, {}: parent links {:.2f} us/playout, update_path {:.2f} us/playout, speedup {:.2f}x"
+              .format(label, 1e6 / parents_rate, 1e6 / path_rate, path_rate / parents_rate))
+
+
+def bench_tree_parallel(seconds=3.0, worker_counts=(1, 2, 4, 8, 16), exploration=1.96):
+    """
+    Playouts per second of one TreeParallelMCTS search from the empty board,
+    for each number of worker processes, and the speedup over one worker.
+    Only as many workers as there are cores can scale.
+    """
+    base_rate = None
+    for num_workers in worker_counts:
+        mcts = TreeParallelMCTS(num_workers)
+        mcts.verbose = False
+        start = time.perf_counter()
+        # with this limit the search stops after seconds, for seconds up to 4.5
+        mcts.get_move(GomokuBoard(7), BLACK, seconds + 0.5, None, exploration)
+        rate = mcts._store.visits[mcts._root] / (time.perf_counter() - start)
+        mcts.close()
+        if base_rate is None:
+            base_rate = rate
+        print("tree_parallel: {:2d} workers {:.1f} playouts/s, speedup {:.2f}x"
+              .format(num_workers, rate, rate / base_rate))
+
+
+def bench_leaf_rollouts(seconds=3.0, batch_sizes=(1, 4, 16, 64), exploration=1.96):
+    """
+    Rollouts per second of a sequential MCTS search from the empty board,
+    with a batch of rollouts from every leaf.
+    """
+    for leaf_rollouts in batch_sizes:
+        mcts = MCTS()
+        mcts.early_stop = False
+        mcts.verbose = False
+        mcts.leaf_rollouts = leaf_rollouts
+        start = time.perf_counter()
+        # with this limit the search stops after seconds, for seconds up to 4.5
+        mcts.get_move(GomokuBoard(7), BLACK, seconds + 0.5, None, exploration)
+        elapsed = time.perf_counter() - start
+        rollouts = mcts._store.visits[mcts._root]
+        print("leaf_rollouts: {:2d} per leaf, {:.1f} rollouts/s, {:.1f} leaves/s"
+              .format(leaf_rollouts, rollouts / elapsed, rollouts / leaf_rollouts / elapsed))
+
+
+def bench_batch_playout(seconds=2.0, batch_sizes=(16, 256, 4096), num_positions=64):
+    """
+    Random games per second from a set of opening positions, one at a time
+    with Play_for_evaluate.playGame against batch_playout on a batch of them.
+    """
+    positions = []
+    for _ in range(num_positions):
+        board = GomokuBoard(7)
+        for _ in range(random.randint(0, 6)):
+            board.play_move_gomoku(random.choice(board.get_empty_points()), board.current_player)
+        positions.append(board)
+    cycle = [0]
+    def sequential():
+        board = positions[cycle[0] % num_positions]
+        cycle[0] += 1
+        moves = len(board.moves)
+        Play_for_evaluate.playGame(board, board.current_player)
+        board.undo_to(moves)
+    base_rate = timed_rate(sequential, seconds)
+    print("batch_playout: playGame {:.0f} games/s".format(base_rate))
+    windows = five_windows(7)
+    for batch_size in batch_sizes:
+        picks = [positions[i % num_positions] for i in range(batch_size)]
+        boards = np.array([board.board for board in picks], dtype = np.int32)
+        to_play = np.array([board.current_player for board in picks], dtype = np.int32)
+        rate = batch_size * timed_rate(lambda: batch_playout(boards, to_play, windows), seconds)
+        print("batch_playout: batch of {:4d} {:.0f} games/s, speedup {:.1f}x"
+              .format(batch_size, rate, rate / base_rate))
+
+
+def bench_rollout(seconds=3.0):
+    """
+    Rollouts per second from the empty board, filling the board
+    against Play_for_evaluate.rollout, which stops at the first five.
+    """
+    board = GomokuBoard(7)
+    def fill():
+        fill_playout(board)
+        board.undo_to(0)
+    plies = []
+    def first_five():
+        plies.append(Play_for_evaluate.rollout(board)[1])
+        board.undo_to(0)
+    fill_rate = timed_rate(fill, seconds)
+    rate = timed_rate(first_five, seconds)
+    print("rollout: fill the board {:.0f} rollouts/s, stop at first five {:.0f} rollouts/s, "
+          "speedup {:.2f}x, {:.1f} plies per rollout"
+          .format(fill_rate, rate, rate / fill_rate, float(sum(plies)) / len(plies)))
+
+
+def bench_transpositions(num_simulation=5000, exploration=1.96):
+    """
+    The same number of playouts from the empty board with the tree search
+    and the transposition table search: playouts per second, stored nodes
+    or positions, visits per stored position of the table, and memory.
+    """
+    mcts = MCTS()
+    mcts.early_stop = False
+    mcts.verbose = False
+    start = time.perf_counter()
+    mcts.get_move(GomokuBoard(7), BLACK, None, num_simulation, exploration)
+    elapsed = time.perf_counter() - start
+    store = mcts._store
+    print("transpositions: tree {:.0f} playouts/s, {} nodes, {:.1f} MB"
+          .format(num_simulation / elapsed, store.num_nodes, store.memory_bytes() / 1e6))
+    mcts = TranspositionMCTS()
+    mcts.verbose = False
+    start = time.perf_counter()
+    mcts.get_move(GomokuBoard(7), BLACK, None, num_simulation, exploration)
+    elapsed = time.perf_counter() - start
+    table = mcts._table
+    print("transpositions: table {:.0f} playouts/s, {} positions, {:.2f} visits per position, {:.1f} MB"
+          .format(num_simulation / elapsed, table.num_entries,
+                  table.visits.sum() / table.num_entries, table.memory_bytes() / 1e6))
+
+
+def play_match_game(players, size, limit, num_simulation, exploration):
+    """
+    One game between two searches, players[BLACK] and players[WHITE],
+    each move searched with the limit and num_simulation of get_move,
+    and tree reuse. Returns the winner or None.
+    """
+    board = GomokuBoard(size)
+    while board.get_winner() is None and board.get_empty_points():
+        color = board.current_player
+        move = players[color].get_move(board, color, limit, num_simulation, exploration)
+        board.play_move_gomoku(move, color)
+        for player in players.values():
+            player.update_with_move(move, board)
+    return board.get_winner()
+
+
+def bench_widening(num_games=24, seconds=0.1, sizes=(7, 9), exploration=1.96):
+    """
+    Games between the search with neighbourhood candidates and progressive
+    widening and the full-width search, at the same time per move,
+    each side playing black in half of them.
+    """
+    for size in sizes:
+        wins = draws = 0
+        start = time.perf_counter()
+        for game in range(num_games):
+            widened = MCTS()
+            widened.widening = True
+            full = MCTS()
+            for mcts in [widened, full]:
+                mcts.verbose = False
+            color = BLACK if game % 2 == 0 else WHITE
+            players = {color: widened, GoBoardUtil.opponent(color): full}
+            # with this limit the search stops after seconds, for seconds up to 4.5
+            winner = play_match_game(players, size, seconds + TIME_MARGIN, None, exploration)
+            if winner == color:
+                wins += 1
+            elif winner is None:
+                draws += 1
+        print("widening: {}x{}, {:.2f}s per move, widening against full width: "
+              "{} wins, {} draws, {} losses in {:.0f}s"
+              .format(size, size, seconds, wins, draws, num_games - wins - draws,
+                      time.perf_counter() - start))
+
+
+def bench_rave(num_games=24, num_simulation=500, size=7, exploration=1.96):
+    """
+    Games between the search with RAVE and the plain search, at the same
+    number of playouts per move, each side playing black in half of them.
+    """
+    wins = draws = 0
+    start = time.perf_counter()
+    for game in range(num_games):
+        rave = MCTS()
+        rave.rave = True
+        plain = MCTS()
+        for mcts in [rave, plain]:
+            mcts.verbose = False
+        color = BLACK if game % 2 == 0 else WHITE
+        players = {color: rave, GoBoardUtil.opponent(color): plain}
+        winner = play_match_game(players, size, None, num_simulation, exploration)
+        if winner == color:
+            wins += 1
+        elif winner is None:
+            draws += 1
+    print("rave: {}x{}, {} playouts per move, RAVE against plain UCT: "
+          "{} wins, {} draws, {} losses in {:.0f}s"
+          .format(size, size, num_simulation, wins, draws, num_games - wins - draws,
+                  time.perf_counter() - start))
+
+
+"""
+Decided positions on the 7x7 board for bench_solver:
+name, black stones, white stones as (row, col), played alternately from black
+"""
+SOLVER_POSITIONS = [
+    ("black to move has a four", [(1, 1), (1, 2), (1, 3), (1, 4)], [(3, 3), (4, 4), (5, 5), (7, 7)]),
+    ("white to move against an open four", [(2, 2), (2, 3), (2, 4), (2, 5)], [(5, 5), (6, 6), (5, 1)]),
+    ("black to move has an open three", [(3, 2), (3, 3), (3, 4)], [(6, 6), (6, 1), (7, 4)]),
+]
+
+
+def position_board(black, white, size=7):
+    """
+    Board with the black and white stones, given as (row, col),
+    played alternately from black
+    """
+    board = GomokuBoard(size)
+    for i, point in enumerate(black):
+        board.play_move_gomoku(coord_to_point(point[0], point[1], size), BLACK)
+        if i < len(white):
+            board.play_move_gomoku(coord_to_point(white[i][0], white[i][1], size), WHITE)
+    return board
+
+
+def bench_solver(limit=10.0, exploration=1.96):
+    """
+    Playouts and seconds until the root of a decided position is proven,
+    out of a search of limit seconds.
+    """
+    for name, black, white in SOLVER_POSITIONS:
+        board = position_board(black, white)
+        mcts = MCTS()
+        mcts.verbose = False
+        start = time.perf_counter()
+        mcts.get_move(board, board.current_player, limit, None, exploration)
+        elapsed = time.perf_counter() - start
+        proven = mcts._store.proven[mcts._root] != NOT_PROVEN
+        print("solver: {}: {} after {:.0f} playouts in {:.2f}s of {:.0f}s"
+              .format(name, "proven" if proven else "not proven",
+                      mcts._store.visits[mcts._root], elapsed, limit))
+
+
+"""
+Tactical suite for bench_tactics on the 7x7 board:
+name, black stones, white stones, and the correct answers, as (row, col)
+"""
+TACTICAL_POSITIONS = [
+    ("win", [(1, 1), (1, 2), (1, 3), (1, 4)], [(3, 3), (4, 4), (5, 5), (7, 7)], [(1, 5)]),
+    ("block a four", [(4, 1), (2, 2), (6, 6), (4, 7)], [(7, 1), (7, 2), (7, 3), (7, 4)], [(7, 5)]),
+    ("make an open four", [(3, 2), (3, 3), (3, 4)], [(6, 6), (6, 1), (7, 4)], [(3, 5)]),
+    ("block an open three", [(1, 1), (7, 1), (7, 7)], [(4, 3), (4, 4), (4, 5)], [(4, 2), (4, 6)]),
+]
+
+
+def bench_tactics(budgets=(10, 20, 50, 100, 200, 500, 1000, 2000, 5000), trials=3, exploration=1.96):
+    """
+    For each position of the tactical suite, the smallest number of playouts
+    in budgets after which trials fresh searches all play a correct answer,
+    without and with pattern priors.
+    """
+    totals = {}
+    for priors in [False, True]:
+        label = "priors" if priors else "no priors"
+        totals[label] = 0
+        start = time.perf_counter()
+        for name, black, white, answers in TACTICAL_POSITIONS:
+            board = position_board(black, white)
+            correct = [coord_to_point(row, col, board.size) for row, col in answers]
+            needed = None
+            for budget in budgets:
+                moves = []
+                for _ in range(trials):
+                    mcts = MCTS()
+                    mcts.verbose = False
+                    mcts.priors = priors
+                    moves.append(mcts.get_move(board, board.current_player, None, budget, exploration))
+                if all(move in correct for move in moves):
+                    needed = budget
+                    break
+            print("tactics: {}, {}: {}".format(label, name,
+                  "{} playouts".format(needed) if needed else "not found"))
+            totals[label] += needed if needed else 2 * budgets[-1]
+        print("tactics: {}, {} playouts for the suite in {:.1f}s"
+              .format(label, totals[label], time.perf_counter() - start))
+    print("tactics: speedup with priors {:.1f}x".format(float(totals["no priors"]) / totals["priors"]))
+
+
+BENCHMARKS = {
+    "game_end": bench_game_end,
+    "boards": bench_boards,
+    "copy": bench_copy,
+    "select": bench_select,
+    "backprop": bench_backprop,
+    "tree_parallel": bench_tree_parallel,
+    "leaf_rollouts": bench_leaf_rollouts,
+    "batch_playout": bench_batch_playout,
+    "rollout": bench_rollout,
+    "transpositions": bench_transpositions,
+    "widening": bench_widening,
+    "solver": bench_solver,
+    "rave": bench_rave,
+    "tactics": bench_tactics,
+}
+
+
+def run(names):
+    for name in names or sorted(BENCHMARKS):
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    run(sys.argv[1:])
@@ -0,0 +1,75 @@
+"""
+bit_patterns.py
+
+Pattern matching on integer bitboards, for GomokuBoard.get_pattern_moves
+and list_solve_point.
+
+Bit p of a bitboard stands for point p of the padded 1-dimensional
+representation used by coord_to_point. Every row is followed by a BORDER
+point, so shifting by one of the four direction offsets never wraps a line
+onto the next row.
+"""
+
+"""
+Patterns for get_pattern_moves and list_solve_point, from the point of view
+of the player to move: 'x' own stone, 'o' opponent stone, '.' empty, 'B' border.
+Each pattern maps to the distances of the answer points from its last point.
+The lists are in order of preference: Win, BlockWin, OpenFour, BlockOpenFour.
+"""
+PATTERN_LIST = [
+    {'xxxx.':{0},'xxx.x':{1},'xx.xx':{2},'x.xxx':{3},'.xxxx':{4}}, #win
+    {'oooo.':{0},'ooo.o':{1},'oo.oo':{2},'o.ooo':{3},'.oooo':{4}}, #block win
+    {'.xxx..':{1},'..xxx.':{4},'.xx.x.':{2},'.x.xx.':{3}}, #make-four
+    {'.ooo..':{1,5},'..ooo.':{0,4},'.oo.o.':{0,2,5},'.o.oo.':{0,3,5}, 'B.ooo..':{0}, '..ooo.B':{6},
+     'x.ooo..':{0}, '..ooo.x':{6} #block-open-four
+    }]
+
+SOLVE_PATTERN_LIST = [
+    {'xxxx.':{0},'xxx.x':{1},'xx.xx':{2},'x.xxx':{3},'.xxxx':{4}},
+    {'oooo.':{0},'ooo.o':{1},'oo.oo':{2},'o.ooo':{3},'.oooo':{4}},
+    {'.xxx..':{1},'..xxx.':{4},'.xx.x.':{2},'.x.xx.':{3}},
+    {'.ooo..':{1,5},'..ooo.':{0,4},'.oo.o.':{2},'.o.oo.':{3}}]
+
+
+def bits_to_points(bits):
+    """
+    Return the list of points whose bit is set, in increasing order.
+    """
+    points = []
+    while bits:
+        low = bits & -bits
+        points.append(low.bit_length() - 1)
+        bits ^= low
+    return points
+
+
+def match_pattern(pattern, masks, d):
+    """
+    Return the bitboard of start points s such that the points
+    s, s + d, s + 2d, ... spell pattern.
+    masks maps each pattern character to the bitboard of points it matches.
+    """
+    starts = -1
+    for i, c in enumerate(pattern):
+        starts &= masks[c] >> (i * d)
+        if not starts:
+            break
+    return starts
+
+
+def pattern_move_bits(masks, directions, pattern_list):
+    """
+    Return one bitboard of answer points for each pattern class in pattern_list.
+    """
+    move_bits = []
+    for patterns in pattern_list:
+        bits = 0
+        for pattern, distances in patterns.items():
+            last = len(pattern) - 1
+            for d in directions:
+                starts = match_pattern(pattern, masks, d)
+                if starts:
+                    for dis in distances:
+                        bits |= starts << ((last - dis) * d)
+        move_bits.append(bits)
+    return move_bits
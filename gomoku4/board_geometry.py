@@ -0,0 +1,167 @@
+"""
+board_geometry.py
+
+The parts of a board that depend only on its size:
+row starts, neighbor lists, lines and five-point windows,
+and empty-board templates.
+
+get_geometry computes them once per board size. Every board of that
+size shares the same BoardGeometry, so reset and copy do not rebuild it.
+Nothing in a BoardGeometry may be modified.
+"""
+
+import numpy as np
+from board_util import EMPTY, BLACK, WHITE, BORDER, MAXSIZE
+
+"""
+Seed of the Zobrist tables. It is fixed so that position hashes are
+the same in every process and every run.
+"""
+ZOBRIST_SEED = 20190410
+
+"""
+Candidate moves for the search are the empty points within this
+distance (in rows or columns, diagonals included) of a stone
+"""
+NEAR_DISTANCE = 2
+
+class BoardGeometry(object):
+
+    def __init__(self, size):
+        """
+        Compute the geometry of a board of given size,
+        using the padded 1-d encoding of coord_to_point
+        """
+        assert 2 <= size <= MAXSIZE
+        self.size = size
+        self.NS = size + 1
+        self.WE = 1
+        self.maxpoint = size * size + 3 * (size + 1)
+        # horizontal, vertical, y=x and y=-x offsets
+        self.directions = (1, self.NS, self.NS + 1, self.NS - 1)
+        self.row_starts = tuple(row * self.NS + 1 for row in range(1, size + 1))
+        self.points = tuple(start + i for start in self.row_starts for i in range(size))
+        # position of each point in self.points, -1 for BORDER points
+        self.point_index = [-1] * self.maxpoint
+        for i, point in enumerate(self.points):
+            self.point_index[point] = i
+
+        self.empty_board = np.full(self.maxpoint, BORDER, dtype = np.int32)
+        self.empty_board[list(self.points)] = EMPTY
+        self.empty_board.flags.writeable = False
+        self.empty_list = self.empty_board.tolist()
+        self.on_board = 0
+        for point in self.points:
+            self.on_board |= 1 << point
+        self.border = ((1 << self.maxpoint) - 1) & ~self.on_board
+
+        self.neighbors = []
+        self.diag_neighbors = []
+        for point in range(self.maxpoint):
+            if self.empty_list[point] == BORDER:
+                self.neighbors.append([])
+                self.diag_neighbors.append([])
+            else:
+                self.neighbors.append([nb for nb in
+                    [point - 1, point + 1, point - self.NS, point + self.NS]
+                    if self.empty_list[nb] != BORDER])
+                self.diag_neighbors.append([point - self.NS - 1,
+                                            point - self.NS + 1,
+                                            point + self.NS - 1,
+                                            point + self.NS + 1])
+        self._initialize_lines()
+        self._initialize_windows()
+        self._initialize_zobrist()
+        self._initialize_near()
+
+    def _line_from(self, point, shift):
+        line = []
+        while 0 <= point < self.maxpoint and self.empty_list[point] != BORDER:
+            line.append(point)
+            point += shift
+        return tuple(line)
+
+    def _initialize_lines(self):
+        """
+        All rows, columns, and diagonals of length at least 5, by name
+        """
+        size = self.size
+        self.lines = {}
+        for i in range(1, size + 1):
+            self.lines["horizontal{}".format(i)] = self._line_from(self.row_starts[i - 1], 1)
+            self.lines["vertical{}".format(i)] = self._line_from(self.row_starts[0] + i - 1, self.NS)
+        up_starts = [(1, col) for col in range(size - 4, 0, -1)] + \
+                    [(row, 1) for row in range(2, size - 3)]
+        down_starts = [(1, col) for col in range(5, size + 1)] + \
+                      [(row, size) for row in range(2, size - 3)]
+        for i, (row, col) in enumerate(up_starts):
+            self.lines["SWtoNE{}".format(i + 1)] = self._line_from(row * self.NS + col, self.NS + 1)
+        for i, (row, col) in enumerate(down_starts):
+            self.lines["SEtoNW{}".format(i + 1)] = self._line_from(row * self.NS + col, self.NS - 1)
+
+    def _initialize_windows(self):
+        """
+        windows: every five consecutive points on a line.
+        point_windows: for each point, the indices of the windows through it.
+        """
+        self.windows = []
+        self.point_windows = [[] for _ in range(self.maxpoint)]
+        for point in self.points:
+            for shift in self.directions:
+                window = self._line_from(point, shift)[:5]
+                if len(window) == 5:
+                    for p in window:
+                        self.point_windows[p].append(len(self.windows))
+                    self.windows.append(window)
+
+    def _initialize_zobrist(self):
+        """
+        zobrist[color][point]: 64-bit key of a stone of color on point,
+        0 for EMPTY and BORDER.
+        zobrist_to_play[color]: key of color being the player to move.
+        """
+        rng = np.random.RandomState(ZOBRIST_SEED + self.size)
+        halves = rng.randint(0, 2 ** 32, size = (2 * self.maxpoint + 1, 2), dtype = np.int64)
+        keys = [(int(hi) << 32) | int(lo) for hi, lo in halves]
+        self.zobrist = [[0] * self.maxpoint for _ in range(BORDER + 1)]
+        for point in self.points:
+            self.zobrist[BLACK][point] = keys[2 * point]
+            self.zobrist[WHITE][point] = keys[2 * point + 1]
+        self.zobrist_to_play = [0] * (BORDER + 1)
+        self.zobrist_to_play[WHITE] = keys[-1]
+
+    def _near_mask(self, point, distance):
+        NS = self.NS
+        mask = 0
+        for drow in range(-distance, distance + 1):
+            for dcol in range(-distance, distance + 1):
+                p = point + drow * NS + dcol
+                # dcol may wrap around into the next row; the column check rejects it
+                if 0 <= p < self.maxpoint and self.empty_list[p] != BORDER and \
+                   abs(p % NS - point % NS) <= distance:
+                    mask |= 1 << p
+        return mask
+
+    def _initialize_near(self):
+        """
+        near_masks[point]: bits of the points within NEAR_DISTANCE of point.
+        adjacent_masks[point]: bits of the 8 points around point.
+        Both are 0 for BORDER points.
+        """
+        self.near_masks = [0] * self.maxpoint
+        self.adjacent_masks = [0] * self.maxpoint
+        for point in self.points:
+            self.near_masks[point] = self._near_mask(point, NEAR_DISTANCE)
+            self.adjacent_masks[point] = self._near_mask(point, 1) & ~(1 << point)
+
+_geometries = {}
+
+def get_geometry(size):
+    """
+    Return the shared BoardGeometry for boards of given size
+    """
+    geometry = _geometries.get(size)
+    if geometry is None:
+        geometry = BoardGeometry(size)
+        _geometries[size] = geometry
+    return geometry
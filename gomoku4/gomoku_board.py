@@ -0,0 +1,284 @@
+"""
+gomoku_board.py
+
+Implements a Gomoku board with only the operations the game needs:
+- play and undo a move
+- list the empty points, and the empty points near the stones
+- report the winner
+- find pattern moves
+
+The board uses the same padded 1-dimensional representation as
+SimpleGoBoard, stored in a Python list. Every empty point is legal,
+so there is no capture, liberty, ko or eye logic.
+"""
+
+from board_util import GoBoardUtil, BLACK, WHITE, EMPTY, BORDER, \
+                       PASS, is_black_white, coord_to_point, MAXSIZE
+from board_geometry import get_geometry
+from bit_patterns import PATTERN_LIST, SOLVE_PATTERN_LIST, \
+                         bits_to_points, pattern_move_bits
+import alphabeta
+
+class GomokuBoard(object):
+
+    __slots__ = ('size', 'NS', 'WE', 'maxpoint', 'current_player',
+                 'board', 'empty_points', 'empty_index', 'moves', 'stone_hash',
+                 'black', 'white', 'near', 'near_stack', 'geometry', 'directions',
+                 'winner', 'winning_point')
+
+    def __init__(self, size):
+        """
+        Creates a Gomoku board of given size
+        """
+        assert 2 <= size <= MAXSIZE
+        self.reset(size)
+
+    def reset(self, size):
+        """
+        Creates a start state, an empty board with the given size
+        See GoBoardUtil.coord_to_point for explanations of the array encoding
+        """
+        geometry = get_geometry(size)
+        self.geometry = geometry
+        self.size = size
+        self.NS = geometry.NS
+        self.WE = geometry.WE
+        self.maxpoint = geometry.maxpoint
+        self.directions = geometry.directions
+        self.current_player = BLACK
+        self.winner = None
+        self.winning_point = None
+        self.moves = []
+        self.stone_hash = 0
+        self.board = geometry.empty_list[:]
+        self.empty_points = list(geometry.points)
+        self.empty_index = geometry.point_index[:]
+        self.black = 0
+        self.white = 0
+        # points near a stone, and the value of near before each move
+        self.near = 0
+        self.near_stack = []
+
+    def copy(self):
+        b = GomokuBoard.__new__(GomokuBoard)
+        b.geometry = self.geometry
+        b.size = self.size
+        b.NS = self.NS
+        b.WE = self.WE
+        b.maxpoint = self.maxpoint
+        b.directions = self.directions
+        b.current_player = self.current_player
+        b.board = self.board[:]
+        b.empty_points = self.empty_points[:]
+        b.empty_index = self.empty_index[:]
+        b.moves = self.moves[:]
+        b.stone_hash = self.stone_hash
+        b.black = self.black
+        b.white = self.white
+        b.near = self.near
+        b.near_stack = self.near_stack[:]
+        b.winner = self.winner
+        b.winning_point = self.winning_point
+        return b
+
+    def row_start(self, row):
+        assert row >= 1
+        assert row <= self.size
+        return row * self.NS + 1
+
+    def pt(self, row, col):
+        return coord_to_point(row, col, self.size)
+
+    def get_color(self, point):
+        return self.board[point]
+
+    def get_empty_points(self):
+        """
+        Return:
+            The empty points on the board, as a new list in no particular order
+        """
+        return self.empty_points[:]
+
+    def get_candidate_points(self):
+        """
+        Return:
+            The empty points within NEAR_DISTANCE of a stone, those next to
+            the most stones first, or every empty point if there is no stone
+        """
+        if not self.moves:
+            return self.get_empty_points()
+        stones = self.black | self.white
+        points = bits_to_points(self.near & ~stones)
+        adjacent_masks = self.geometry.adjacent_masks
+        points.sort(key = lambda p: -bin(adjacent_masks[p] & stones).count('1'))
+        return points
+
+    def is_legal_gomoku(self, point, color):
+        """
+        Check whether it is legal for color to play on point, for the game of gomoku
+        """
+        return self.board[point] == EMPTY
+
+    def play_move_gomoku(self, point, color):
+        """
+        Play a move of color on point, for the game of gomoku,
+        and push it on the move stack.
+        Returns boolean: whether move was legal
+        """
+        assert is_black_white(color)
+        assert point != PASS
+        if self.board[point] != EMPTY:
+            return False
+        self.moves.append((point, self.current_player))
+        self.stone_hash ^= self.geometry.zobrist[color][point]
+        self.board[point] = color
+        # swap-remove point from the empty list
+        i = self.empty_index[point]
+        last = self.empty_points.pop()
+        if last != point:
+            self.empty_points[i] = last
+            self.empty_index[last] = i
+        self.empty_index[point] = -1
+        if color == BLACK:
+            self.black |= 1 << point
+        else:
+            self.white |= 1 << point
+        self.near_stack.append(self.near)
+        self.near |= self.geometry.near_masks[point]
+        self.current_player = GoBoardUtil.opponent(color)
+        if self.winner is None and self.point_check_game_end_gomoku(point):
+            self.winner = color
+            self.winning_point = point
+        return True
+
+    def undo_move(self):
+        """
+        Pop the last move off the move stack and take it back,
+        restoring the player to move and the winner.
+        Returns the point of the move.
+        """
+        point, player = self.moves.pop()
+        self.stone_hash ^= self.geometry.zobrist[self.board[point]][point]
+        self.board[point] = EMPTY
+        self.empty_index[point] = len(self.empty_points)
+        self.empty_points.append(point)
+        self.black &= ~(1 << point)
+        self.white &= ~(1 << point)
+        self.near = self.near_stack.pop()
+        self.current_player = player
+        if point == self.winning_point:
+            self.winner = None
+            self.winning_point = None
+        return point
+
+    def undo_move_gomoku(self, point):
+        """
+        Take back the stone on point, which must be the last move played.
+        """
+        assert self.moves and self.moves[-1][0] == point
+        self.undo_move()
+
+    def undo_to(self, num_moves):
+        """
+        Take back moves until only the first num_moves remain on the stack.
+        """
+        while len(self.moves) > num_moves:
+            self.undo_move()
+
+    def _point_direction_check_connect_gomoko(self, point, shift):
+        """
+        Check if the point has connect5 condition in a direction
+        """
+        board = self.board
+        color = board[point]
+        count = 1
+        p = point + shift
+        while count < 5 and board[p] == color:
+            count += 1
+            p += shift
+        p = point - shift
+        while count < 5 and board[p] == color:
+            count += 1
+            p -= shift
+        return count == 5
+
+    def point_check_game_end_gomoku(self, point):
+        """
+        Check if the stone on point is part of five in a row
+        """
+        for shift in self.directions:
+            if self._point_direction_check_connect_gomoko(point, shift):
+                return True
+        return False
+
+    def get_winner(self):
+        """
+        Return the color that made the first five, or None
+        """
+        return self.winner
+
+    def get_hash(self):
+        """
+        64-bit Zobrist hash of the stones and the player to move.
+        The stone part is kept up to date by play_move_gomoku and undo_move.
+        """
+        return self.stone_hash ^ self.geometry.zobrist_to_play[self.current_player]
+
+    def check_game_end_gomoku(self):
+        """
+        Check if the game ends for the game of Gomoku.
+        """
+        if self.winner is None:
+            return False, None
+        return True, self.winner
+
+    def _pattern_masks(self):
+        if self.current_player == BLACK:
+            own, opp = self.black, self.white
+        else:
+            own, opp = self.white, self.black
+        return {'x': own, 'o': opp, 'B': self.geometry.border,
+                '.': self.geometry.on_board & ~(self.black | self.white)}
+
+    def get_pattern_moves(self):
+        """
+        Return the index of the first pattern class in PATTERN_LIST
+        (Win, BlockWin, OpenFour, BlockOpenFour) that has an answer
+        for the player to move, and its moves.
+        Returns (4, None) if no pattern applies.
+        """
+        move_bits = pattern_move_bits(self._pattern_masks(), self.directions, PATTERN_LIST)
+        for i, bits in enumerate(move_bits):
+            if bits:
+                return i, bits_to_points(bits)
+        return len(move_bits), None
+
+    def list_solve_point(self):
+        """
+        Moves of the first pattern class in SOLVE_PATTERN_LIST with an answer, or None
+        """
+        move_bits = pattern_move_bits(self._pattern_masks(), self.directions, SOLVE_PATTERN_LIST)
+        for bits in move_bits:
+            if bits:
+                return bits_to_points(bits)
+        return None
+
+    def solve(self):
+        """
+        Solve the position with alphabeta.
+        Returns (winner, move): winner is 'b', 'w' or 'draw', and move is
+        a winning move for the player to move, or "NoMove".
+        """
+        result, move = alphabeta.solve(self)
+        opponent_wins = 'w' if self.current_player != WHITE else 'b'
+        if move == "First":
+            if result == 0:
+                return 'draw', "NoMove"
+            return opponent_wins, "NoMove"
+        elif move == "NoMove":
+            if result:
+                return 'draw', move
+            return opponent_wins, move
+        else:
+            winner = 'w' if self.current_player == WHITE else 'b'
+            return winner, move
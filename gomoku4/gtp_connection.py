@@ -60,7 +60,16 @@ class GtpConnection():
             "solve": self.solve_cmd,
             "list_solve_point": self.list_solve_point_cmd, # below is added for Gomoku3
             "policy": self.set_playout_policy, 
-            "policy_moves": self.display_pattern_moves
+            "policy_moves": self.display_pattern_moves,
+            "parallel": self.parallel_cmd,
+            "leaf_rollouts": self.leaf_rollouts_cmd,
+            "transpositions": self.transpositions_cmd,
+            "ponder": self.ponder_cmd,
+            "widening": self.widening_cmd,
+            "rave": self.rave_cmd,
+            "priors": self.priors_cmd,
+            "memory_limit": self.memory_limit_cmd,
+            "memory": self.memory_cmd
         }
         #self.timelimit = 58
         self.timelimit = 55
@@ -75,7 +84,16 @@ class GtpConnection():
             "genmove": (1, 'Usage: genmove {w,b}'),
             "play": (2, 'Usage: play {b,w} MOVE'),
             "legal_moves": (1, 'Usage: legal_moves {w,b}'),
-            "policy":(1, 'Usage: set playout policy {random, rule_based}')
+            "policy":(1, 'Usage: set playout policy {random, rule_based}'),
+            "parallel":(2, 'Usage: parallel {off,root,tree} INT'),
+            "leaf_rollouts":(1, 'Usage: leaf_rollouts INT'),
+            "transpositions":(1, 'Usage: transpositions {on,off}'),
+            "ponder":(1, 'Usage: ponder {on,off}'),
+            "widening":(1, 'Usage: widening {on,off}'),
+            "rave":(1, 'Usage: rave {on,off}'),
+            "priors":(1, 'Usage: priors {on,off}'),
+            "memory_limit":(2, 'Usage: memory_limit {nodes,mb} INT (0 for no limit)'),
+            "timelimit":(1, 'Usage: timelimit SECONDS')
         }
     
     def set_playout_policy(self, args):
@@ -83,6 +101,100 @@ class GtpConnection():
         self.go_engine.set_playout_policy(playout_policy)
         self.respond()
 
+    def parallel_cmd(self, args):
+        """
+        Select the parallel search args[0] with args[1] worker processes
+        """
+        mode = args[0].lower()
+        if mode not in ['off', 'root', 'tree'] or not args[1].isdigit() or int(args[1]) < 1:
+            self.error(self.argmap["parallel"][1])
+            return
+        self.go_engine.set_parallel(mode, int(args[1]))
+        self.respond()
+
+    def leaf_rollouts_cmd(self, args):
+        """
+        Run args[0] rollouts as one batch from every leaf of the search
+        """
+        if not args[0].isdigit() or int(args[0]) < 1:
+            self.error(self.argmap["leaf_rollouts"][1])
+            return
+        self.go_engine.set_leaf_rollouts(int(args[0]))
+        self.respond()
+
+    def transpositions_cmd(self, args):
+        """
+        Turn the transposition table search on or off
+        """
+        if args[0].lower() not in ['on', 'off']:
+            self.error(self.argmap["transpositions"][1])
+            return
+        self.go_engine.set_transpositions(args[0].lower() == 'on')
+        self.respond()
+
+    def ponder_cmd(self, args):
+        """
+        Turn searching while waiting for commands on or off
+        """
+        if args[0].lower() not in ['on', 'off']:
+            self.error(self.argmap["ponder"][1])
+            return
+        self.go_engine.set_ponder(args[0].lower() == 'on')
+        self.respond()
+
+    def widening_cmd(self, args):
+        """
+        Turn neighbourhood candidates with progressive widening on or off
+        """
+        if args[0].lower() not in ['on', 'off']:
+            self.error(self.argmap["widening"][1])
+            return
+        self.go_engine.set_widening(args[0].lower() == 'on')
+        self.respond()
+
+    def rave_cmd(self, args):
+        """
+        Turn RAVE (all-moves-as-first statistics) on or off
+        """
+        if args[0].lower() not in ['on', 'off']:
+            self.error(self.argmap["rave"][1])
+            return
+        self.go_engine.set_rave(args[0].lower() == 'on')
+        self.respond()
+
+    def priors_cmd(self, args):
+        """
+        Turn pattern priors for new tree nodes on or off
+        """
+        if args[0].lower() not in ['on', 'off']:
+            self.error(self.argmap["priors"][1])
+            return
+        self.go_engine.set_priors(args[0].lower() == 'on')
+        self.respond()
+
+    def memory_limit_cmd(self, args):
+        """
+        Limit the search tree to args[1] nodes or megabytes, args[0]
+        saying which; 0 removes the limit. The other limit is kept.
+        """
+        unit = args[0].lower()
+        if unit not in ['nodes', 'mb'] or not args[1].isdigit():
+            self.error(self.argmap["memory_limit"][1])
+            return
+        limit = int(args[1]) or None
+        if unit == 'nodes':
+            self.go_engine.set_memory_limit(max_nodes=limit)
+        else:
+            self.go_engine.set_memory_limit(max_bytes=limit and limit * 1000000)
+        self.respond()
+
+    def memory_cmd(self, args):
+        """
+        Report the size of the search tree: nodes and bytes
+        """
+        nodes, used = self.go_engine.memory_usage()
+        self.respond("nodes {} bytes {}".format(nodes, used))
+
     def display_pattern_moves(self, args):
         game_end, winner = self.board.check_game_end_gomoku()
         color=self.board.current_player
@@ -114,11 +226,16 @@ class GtpConnection():
         """
         Start a GTP connection. 
         This function continuously monitors standard input for commands.
+        While it waits for a command, the engine may ponder.
         """
+        self.go_engine.start_pondering(self.board)
         line = stdin.readline()
         while line:
+            self.go_engine.stop_pondering()
             self.get_cmd(line)
+            self.go_engine.start_pondering(self.board)
             line = stdin.readline()
+        self.go_engine.stop_pondering()
 
     def get_cmd(self, command):
         """
@@ -179,9 +296,11 @@ class GtpConnection():
 
     def reset(self, size):
         """
-        Reset the board to empty board of given size
+        Reset the board to empty board of given size, and the engine
+        with it: its search tree and the time saved in the last game
         """
         self.board.reset(size)
+        self.go_engine.reset()
 
     def board2d(self):
         return str(GoBoardUtil.get_twoD_board(self.board))
@@ -244,7 +363,7 @@ class GtpConnection():
         """
         board_color = args[0].lower()
         color = color_to_int(board_color)
-        moves = GoBoardUtil.generate_legal_moves(self.board, color)
+        moves = GoBoardUtil.generate_legal_moves_gomoku(self.board)
         gtp_moves = []
         for move in moves:
             coords = point_to_coord(move, self.board.size)
@@ -264,7 +383,6 @@ class GtpConnection():
                 return
             color = color_to_int(board_color)
             if args[1].lower() == 'pass':
-                self.board.play_move(PASS, color)
                 self.board.current_player = GoBoardUtil.opponent(color)
                 self.respond()
                 return
@@ -279,6 +397,7 @@ class GtpConnection():
                 self.respond("illegal move: \"{}\" occupied".format(board_move))
                 return
             else:
+                self.go_engine.update(move, self.board)
                 self.debug_msg("Move: {}\nBoard:\n{}\n".
                                 format(board_move, self.board2d()))
             self.respond()
@@ -286,7 +405,17 @@ class GtpConnection():
             self.respond('{}'.format(str(e)))
 
     def timelimit_cmd(self, args):
-        self.timelimit = args[0]
+        """
+        Set the time limit of genmove and solve to args[0] seconds
+        """
+        try:
+            timelimit = float(args[0])
+        except ValueError:
+            timelimit = None
+        if timelimit is None or not 0 < timelimit < float("inf"):
+            self.error(self.argmap["timelimit"][1])
+            return
+        self.timelimit = timelimit
         self.respond('')
 
     def handler(self, signum, fram):
@@ -338,31 +467,21 @@ class GtpConnection():
         move=None
 
         try:
-            #start_time = time.time()
-            #while time.time() - start_time < self.timelimit:
-            signal.alarm(int(self.timelimit))
-            self.sboard = self.board.copy()
-               
+            # the engine searches until its own deadline inside the time limit,
+            # so there is no alarm here that would throw the search away
             _, pattern_moves = self.board.get_pattern_moves()
 
             if pattern_moves is None:
-                move = self.go_engine.get_move_mc(self.board, color)
-                print('i am herez not random')
-                    #elif pattern_moves is not None and len(pattern_moves) != 0:
+                move = self.go_engine.get_move_mc(self.board, color, self.timelimit)
             else:
                 move = random.choice(pattern_moves)
-                #break
 
             if move is None:
-                self.respond("pass 111")
+                self.respond("pass")
                 return
-            
-            signal.alarm(0)
         except Exception as e:
-            
+            self.debug_msg("Error in genmove {}, playing a random move\n".format(str(e)))
             move = GoBoardUtil.generate_random_move_gomoku(self.board)
-            self.respond("random move")
-            print(e.args)
 
         #if move == PASS:
          #   self.respond("pass 222")
@@ -373,6 +492,7 @@ class GtpConnection():
         #print(move_as_string)
         if self.board.is_legal_gomoku(move, color):
             self.board.play_move_gomoku(move, color)
+            self.go_engine.update(move, self.board)
             self.respond(move_as_string)
         else:
             self.respond("illegal move: {}".format(move_as_string))
@@ -0,0 +1,408 @@
+"""
+node_store.py
+
+Struct-of-arrays storage for the MCTS tree.
+
+A node is an integer id that indexes parallel NumPy arrays holding its
+statistics and links. Expanding a node only records its candidate moves,
+in a block of the candidate pool starting at first_child. A child node is
+created the first time selection picks its move, always for the next
+candidate in order, so the children of a node are the first num_children
+candidates of its block: child_ids[first_child + i] is the child for
+candidate_moves[first_child + i]. The arrays grow by doubling when they
+run out of room.
+
+wins of a node are the wins of the player who made the move into it, so
+that selection reads them as they are whichever color is to move; a draw
+counts as a win for white. Backpropagation flips them at every ply.
+
+amaf_visits and amaf_wins hold the all-moves-as-first statistics
+of each candidate move of a node, for RAVE; a candidate has them before
+it has a child. prior_visits and prior_wins are the statistics a
+child starts with when it is created, e.g. from pattern knowledge.
+All of them count the wins of the player making the candidate move.
+
+proven records a game-theoretic value found by the search, from the
+point of view of the player who made the move into the node:
+PROVEN_WIN if that player wins with best play, PROVEN_LOSS if they lose.
+
+SharedNodeStore keeps the same arrays, plus a virtual loss count per node,
+in one multiprocessing.shared_memory block of fixed capacity, so that
+processes forked after it was created all work on the same tree.
+The block starts out zero and the entries of a node or candidate are only
+set to their initial values when it is allocated, so memory pages are only
+touched as the tree grows.
+"""
+
+import numpy as np
+from multiprocessing import shared_memory
+
+"""
+Marker for "no node": the parent of the root, the first child of a node
+that has not been expanded, and the move of the root.
+"""
+NO_NODE = -1
+
+"""
+Values of proven
+"""
+NOT_PROVEN = 0
+PROVEN_WIN = 1
+PROVEN_LOSS = 2
+
+"""
+Name, type and initial value of the arrays with one entry per node,
+and of the arrays with one entry per candidate move
+"""
+NODE_ARRAYS = [('visits', np.float64, 0),
+               ('wins', np.float64, 0),
+               ('move', np.int16, NO_NODE),
+               ('parent', np.int32, NO_NODE),
+               ('first_child', np.int32, NO_NODE),
+               ('num_children', np.int16, 0),
+               ('num_candidates', np.int16, 0),
+               ('proven', np.int8, NOT_PROVEN)]
+POOL_ARRAYS = [('candidate_moves', np.int16, NO_NODE),
+               ('child_ids', np.int32, NO_NODE),
+               ('amaf_visits', np.float32, 0),
+               ('amaf_wins', np.float32, 0),
+               ('prior_visits', np.float32, 0),
+               ('prior_wins', np.float32, 0)]
+"""
+Bytes per node and per candidate move
+"""
+NODE_BYTES = sum(np.dtype(dtype).itemsize for _, dtype, _ in NODE_ARRAYS)
+CANDIDATE_BYTES = sum(np.dtype(dtype).itemsize for _, dtype, _ in POOL_ARRAYS)
+"""
+Pool arrays that belong to a candidate move and move with it
+"""
+CANDIDATE_ARRAYS = ['candidate_moves', 'amaf_visits', 'amaf_wins',
+                    'prior_visits', 'prior_wins']
+
+class NodeStore(object):
+
+    def __init__(self, capacity = 1024, pool_capacity = None):
+        """
+        Creates an empty store with room for capacity nodes
+        and pool_capacity candidate moves (16 per node by default)
+        """
+        if pool_capacity is None:
+            pool_capacity = 16 * capacity
+        self._allocate(capacity, pool_capacity)
+        self.num_nodes = 0
+        self.pool_size = 0
+
+    def _allocate(self, capacity, pool_capacity):
+        self.capacity = capacity
+        self.pool_capacity = pool_capacity
+        for name, dtype, fill in NODE_ARRAYS:
+            setattr(self, name, np.full(capacity, fill, dtype = dtype))
+        for name, dtype, fill in POOL_ARRAYS:
+            setattr(self, name, np.full(pool_capacity, fill, dtype = dtype))
+
+    def _arrays(self):
+        return [name for name, _, _ in NODE_ARRAYS + POOL_ARRAYS]
+
+    def _grow(self, min_capacity, min_pool_capacity):
+        """
+        Make room for at least min_capacity nodes and min_pool_capacity
+        candidates, keeping existing ones
+        """
+        capacity = self.capacity
+        while capacity < min_capacity:
+            capacity *= 2
+        pool_capacity = self.pool_capacity
+        while pool_capacity < min_pool_capacity:
+            pool_capacity *= 2
+        old = [getattr(self, name) for name in self._arrays()]
+        self._allocate(capacity, pool_capacity)
+        for name, array in zip(self._arrays(), old):
+            getattr(self, name)[:len(array)] = array
+
+    def clear(self):
+        """
+        Remove all nodes. The arrays keep their capacity.
+        """
+        n = self.num_nodes
+        for name, _, fill in NODE_ARRAYS:
+            getattr(self, name)[:n] = fill
+        p = self.pool_size
+        for name, _, fill in POOL_ARRAYS:
+            getattr(self, name)[:p] = fill
+        self.num_nodes = 0
+        self.pool_size = 0
+
+    def new_node(self, parent = NO_NODE, move = NO_NODE):
+        """
+        Allocate a single node with no statistics, e.g. a root.
+        Returns its id.
+        """
+        if self.num_nodes + 1 > self.capacity:
+            self._grow(self.num_nodes + 1, self.pool_capacity)
+        node = self.num_nodes
+        self.num_nodes += 1
+        self.parent[node] = parent
+        self.move[node] = move
+        return node
+
+    def add_candidates(self, node, moves):
+        """
+        Expand node with the candidate moves in moves, without creating children.
+        Returns the position of the first one in the pool.
+        """
+        n = len(moves)
+        first = self.pool_size
+        if first + n > self.pool_capacity:
+            self._grow(self.capacity, first + n)
+        self.pool_size += n
+        self.candidate_moves[first:first + n] = moves
+        self.first_child[node] = first
+        self.num_candidates[node] = n
+        return first
+
+    def can_add_child(self, node):
+        """
+        Check if node has a candidate move without a child
+        """
+        return self.num_children[node] < self.num_candidates[node]
+
+    def add_child(self, node, candidate = None):
+        """
+        Create the child of node for its next candidate move, or for the one
+        at position candidate of the pool, which is first swapped into the
+        next position together with its statistics. The child starts with
+        the prior statistics of its candidate.
+        Returns the id of the child.
+        """
+        i = self.first_child[node] + self.num_children[node]
+        if candidate is not None and candidate != i:
+            assert i < candidate < self.first_child[node] + self.num_candidates[node]
+            for name in CANDIDATE_ARRAYS:
+                array = getattr(self, name)
+                array[i], array[candidate] = array[candidate], array[i]
+        child = self.new_node(node, self.candidate_moves[i])
+        self.visits[child] = self.prior_visits[i]
+        self.wins[child] = self.prior_wins[i]
+        self.child_ids[i] = child
+        self.num_children[node] += 1
+        return child
+
+    def is_expanded(self, node):
+        return self.first_child[node] != NO_NODE
+
+    def is_leaf(self, node):
+        """
+        Check if node has no candidate moves (not expanded, or no moves left)
+        """
+        return self.num_candidates[node] == 0
+
+    def children(self, node):
+        """
+        Array of the ids of the children of node that have been created
+        """
+        first = int(self.first_child[node])
+        if first == NO_NODE:
+            return self.child_ids[:0]
+        return self.child_ids[first:first + int(self.num_children[node])]
+
+    def find_child(self, node, move):
+        """
+        Return the child of node reached by move, or NO_NODE
+        if there is none (yet)
+        """
+        children = self.children(node)
+        found = np.nonzero(self.move[children] == move)[0]
+        if len(found) == 0:
+            return NO_NODE
+        return int(children[found[0]])
+
+    def update_path(self, path, visits, wins):
+        """
+        Add visits visits to every node of path, the list of nodes from the
+        root to a leaf that a playout went through, and wins wins to the leaf,
+        the last of them. The wins of the player who moved into the leaf are
+        losses for the one who moved into its parent, so they alternate
+        with wins = visits - wins going up the path.
+        """
+        for node in reversed(path):
+            self.visits[node] += visits
+            self.wins[node] += wins
+            wins = visits - wins
+
+    def propagate_proof(self, node, num_empty = None):
+        """
+        Prove the ancestors of the proven node that follow from it:
+        a node with a child that wins for the player to move is lost for
+        the player who moved into it, and a node whose candidate moves all
+        have children lost for the player to move is won for that player.
+        The second rule needs the candidates to be all the legal moves. If
+        num_empty, the number of empty points at node, is given, it is only
+        applied to an ancestor with one candidate per empty point, so that
+        nodes expanded with part of the moves (widening) are not proven by it.
+        """
+        while self.proven[node] != NOT_PROVEN:
+            parent = self.parent[node]
+            if parent == NO_NODE or self.proven[parent] != NOT_PROVEN:
+                return
+            if num_empty is not None:
+                # the parent has the empty points of node and its move
+                num_empty += 1
+            if self.proven[node] == PROVEN_WIN:
+                self.proven[parent] = PROVEN_LOSS
+            elif self.can_add_child(parent) or \
+                 (num_empty is not None and self.num_candidates[parent] != num_empty) or \
+                 not (self.proven[self.children(parent)] == PROVEN_LOSS).all():
+                return
+            else:
+                self.proven[parent] = PROVEN_WIN
+            node = parent
+
+    def subtree(self, node, leaf_visits = None):
+        """
+        Copy the subtree below node into a new, compact store.
+        If leaf_visits is given, the nodes below node with leaf_visits visits
+        or fewer are copied as leaves, without their candidates and children,
+        so they are expanded again when a playout passes through them.
+        Returns the new store; node becomes its root, id 0.
+        """
+        store = NodeStore()
+        root = store.new_node()
+        store.move[root] = self.move[node]
+        store.visits[root] = self.visits[node]
+        store.wins[root] = self.wins[node]
+        store.proven[root] = self.proven[node]
+        stack = [(node, root)]
+        while stack:
+            old, new = stack.pop()
+            first = self.first_child[old]
+            if first == NO_NODE:
+                continue
+            if leaf_visits is not None and old != node and self.visits[old] <= leaf_visits:
+                continue
+            end = first + self.num_candidates[old]
+            new_first = store.add_candidates(new, self.candidate_moves[first:end])
+            new_end = new_first + end - first
+            for name in CANDIDATE_ARRAYS:
+                getattr(store, name)[new_first:new_end] = getattr(self, name)[first:end]
+            for old_child in self.child_ids[first:first + self.num_children[old]]:
+                new_child = store.add_child(new)
+                store.visits[new_child] = self.visits[old_child]
+                store.wins[new_child] = self.wins[old_child]
+                store.proven[new_child] = self.proven[old_child]
+                stack.append((old_child, new_child))
+        return store
+
+    def memory_bytes(self):
+        """
+        Bytes used by the node and candidate arrays, including unused capacity
+        """
+        return sum(getattr(self, name).nbytes for name in self._arrays())
+
+    def bytes_in_use(self):
+        """
+        Bytes of the node and candidate arrays taken by the nodes
+        and candidate moves in the store
+        """
+        return self.num_nodes * NODE_BYTES + self.pool_size * CANDIDATE_BYTES
+
+
+class SharedNodeStore(NodeStore):
+    """
+    A NodeStore in shared memory. It cannot grow: new_node and add_candidates
+    raise MemoryError when the store is full, so callers check has_room first.
+    The node and candidate counts are kept in shared memory as well.
+    Locking is left to the callers.
+    """
+
+    def _allocate(self, capacity, pool_capacity):
+        self.capacity = capacity
+        self.pool_capacity = pool_capacity
+        # shared memory is zero filled when it is created, the other initial
+        # values are set by new_node and add_candidates
+        layout = [('_counts', np.int64, 2, 0)] + \
+                 [(name, dtype, capacity, fill) for name, dtype, fill in NODE_ARRAYS] + \
+                 [('virtual_loss', np.int32, capacity, 0)] + \
+                 [(name, dtype, pool_capacity, fill) for name, dtype, fill in POOL_ARRAYS]
+        # widest types first, so that every array is aligned
+        layout.sort(key = lambda entry: -np.dtype(entry[1]).itemsize)
+        size = sum(np.dtype(dtype).itemsize * n for _, dtype, n, _ in layout)
+        self._shm = shared_memory.SharedMemory(create = True, size = size)
+        offset = 0
+        for name, dtype, n, fill in layout:
+            array = np.ndarray(n, dtype = dtype, buffer = self._shm.buf, offset = offset)
+            offset += array.nbytes
+            setattr(self, name, array)
+
+    def _arrays(self):
+        return NodeStore._arrays(self) + ['virtual_loss']
+
+    def _grow(self, min_capacity, min_pool_capacity):
+        raise MemoryError("SharedNodeStore is full: {} nodes, {} candidates"
+                          .format(self.capacity, self.pool_capacity))
+
+    @property
+    def num_nodes(self):
+        return int(self._counts[0])
+
+    @num_nodes.setter
+    def num_nodes(self, n):
+        self._counts[0] = n
+
+    @property
+    def pool_size(self):
+        return int(self._counts[1])
+
+    @pool_size.setter
+    def pool_size(self, n):
+        self._counts[1] = n
+
+    def _fill(self, arrays, start, n):
+        """
+        Set entries start to start + n of arrays to their initial values
+        """
+        for name, _, fill in arrays:
+            if fill != 0:
+                getattr(self, name)[start:start + n] = fill
+
+    def new_node(self, parent = NO_NODE, move = NO_NODE):
+        if self.num_nodes < self.capacity:
+            self._fill(NODE_ARRAYS, self.num_nodes, 1)
+        return NodeStore.new_node(self, parent, move)
+
+    def add_candidates(self, node, moves):
+        if self.pool_size + len(moves) <= self.pool_capacity:
+            self._fill(POOL_ARRAYS, self.pool_size, len(moves))
+        return NodeStore.add_candidates(self, node, moves)
+
+    def has_room(self, nodes, candidates = 0):
+        return self.num_nodes + nodes <= self.capacity and \
+               self.pool_size + candidates <= self.pool_capacity
+
+    def clear(self):
+        self.virtual_loss[:self.num_nodes] = 0
+        NodeStore.clear(self)
+
+    def load(self, store):
+        """
+        Replace the contents with a copy of store, a compact NodeStore
+        such as the result of subtree()
+        """
+        self.clear()
+        n = store.num_nodes
+        for name, _, _ in NODE_ARRAYS:
+            getattr(self, name)[:n] = getattr(store, name)[:n]
+        p = store.pool_size
+        for name, _, _ in POOL_ARRAYS:
+            getattr(self, name)[:p] = getattr(store, name)[:p]
+        self.num_nodes = n
+        self.pool_size = p
+
+    def release(self):
+        """
+        Free the shared memory. The store cannot be used afterwards.
+        """
+        for name in self._arrays():
+            setattr(self, name, None)
+        self._counts = None
+        self._shm.close()
+        self._shm.unlink()
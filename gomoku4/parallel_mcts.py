@@ -0,0 +1,531 @@
+"""
+parallel_mcts.py
+
+Root-parallel and tree-parallel MCTS for gomoku.
+
+Both fork a fixed set of worker processes once and reuse them for every move.
+
+RootParallelMCTS: each worker keeps its own MCTS tree and random seed and searches
+the same position independently. When the workers reach the deadline, the visits
+and wins of the root children are summed per move, and the most visited
+move of the merged counts is played, unless a worker has proven a move:
+a proven win is played first, and proven losses only if every move is one.
+
+TreeParallelMCTS: the workers descend one tree kept in a SharedNodeStore.
+A worker adds a virtual loss to every node on its path, so that the others
+prefer different branches until it backs up its result. Statistics are changed
+under one of NUM_LOCKS striped locks, chosen by node id.
+"""
+
+import sys
+import time
+import atexit
+import random
+import multiprocessing
+import numpy as np
+from board_util import GoBoardUtil, BLACK
+from gtp_connection import point_to_coord, format_point
+from gomoku_board import GomokuBoard
+from MCTS import MCTS, best_child, search_deadline, hash_before_move
+from node_store import SharedNodeStore, NO_NODE, NOT_PROVEN, PROVEN_WIN, PROVEN_LOSS, \
+                       NODE_BYTES, CANDIDATE_BYTES
+from play_for_node_eva import Play_for_evaluate
+
+"""
+Number of striped locks of TreeParallelMCTS, and the number of visits
+a worker adds to a node while a playout through it is in progress.
+"""
+NUM_LOCKS = 64
+VIRTUAL_LOSS = 1
+
+"""
+Default number of nodes of the shared tree of TreeParallelMCTS,
+and the number of candidate moves it has room for per node
+"""
+TREE_CAPACITY = 1 << 16
+CANDIDATES_PER_NODE = 16
+
+def tree_capacity(max_nodes = None, max_bytes = None):
+    """
+    Number of nodes of a TreeParallelMCTS tree that keeps within max_nodes
+    nodes and max_bytes bytes of shared memory, TREE_CAPACITY if both are None
+    """
+    if max_nodes is None and max_bytes is None:
+        return TREE_CAPACITY
+    capacity = max_nodes if max_nodes is not None else float("inf")
+    if max_bytes is not None:
+        # the virtual loss count is the 4 bytes a shared node has in addition
+        node_bytes = NODE_BYTES + 4 + CANDIDATES_PER_NODE * CANDIDATE_BYTES
+        capacity = min(capacity, max_bytes // node_bytes)
+    return max(1, int(capacity))
+
+
+def board_position(board):
+    """
+    Picklable description of board: its size, the stones in the order
+    they were played, and the player to move
+    """
+    stones = [(point, board.get_color(point)) for point, _ in board.moves]
+    return board.size, stones, board.current_player
+
+
+def board_from_position(position):
+    """
+    Rebuild a GomokuBoard from the result of board_position
+    """
+    size, stones, current_player = position
+    board = GomokuBoard(size)
+    for point, color in stones:
+        board.play_move_gomoku(point, color)
+    board.current_player = current_player
+    return board
+
+
+def _new_worker_mcts():
+    mcts = MCTS()
+    mcts.verbose = False
+    # the merged counts decide the move, not those of one worker
+    mcts.early_stop = False
+    return mcts
+
+
+def _worker(conn, seed):
+    """
+    Worker process loop. Commands arrive on conn as (name, args) tuples:
+    search -- run MCTS.get_move and send back the root statistics
+    update -- advance the tree by a move, as MCTS.update_with_move
+    memory -- send back MCTS.memory_usage
+    reset  -- start a new tree
+    stop   -- leave the loop
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    mcts = _new_worker_mcts()
+    while True:
+        command, args = conn.recv()
+        if command == 'search':
+            position, toplay, limit, num_simulation, exploration, leaf_rollouts, budget = args
+            mcts.leaf_rollouts = leaf_rollouts
+            mcts.max_nodes, mcts.max_bytes = budget
+            board = board_from_position(position)
+            mcts.get_move(board, toplay, limit, num_simulation, exploration)
+            conn.send(mcts.root_statistics())
+        elif command == 'update':
+            move, position = args
+            board = None if position is None else board_from_position(position)
+            mcts.update_with_move(move, board)
+        elif command == 'memory':
+            conn.send(mcts.memory_usage())
+        elif command == 'reset':
+            mcts = _new_worker_mcts()
+        elif command == 'stop':
+            break
+    conn.close()
+
+
+class RootParallelMCTS(object):
+    """
+    Same interface as MCTS: get_move and update_with_move.
+    """
+    def __init__(self, num_workers, seed=None):
+        assert num_workers >= 1
+        self.num_workers = num_workers
+        self.toplay = BLACK
+        self.verbose = True
+        self.leaf_rollouts = 1
+        # memory budget of the tree of each worker
+        self.max_nodes = None
+        self.max_bytes = None
+        if seed is None:
+            seed = random.randrange(2 ** 31)
+        context = multiprocessing.get_context('fork')
+        self._workers = []
+        for i in range(num_workers):
+            conn, child_conn = context.Pipe()
+            process = context.Process(target=_worker, args=(child_conn, seed + i))
+            process.daemon = True
+            process.start()
+            child_conn.close()
+            self._workers.append((process, conn))
+
+    def _broadcast(self, command, args=None):
+        for _, conn in self._workers:
+            conn.send((command, args))
+
+    def get_move(self,
+            board,
+            toplay,
+            limit,
+            num_simulation,
+            exploration):
+        """
+        Search board in every worker until the deadline derived from limit,
+        with num_simulation playouts shared between the workers.
+        Returns a move that a worker proved to win if there is one, else the
+        most visited move of the merged root statistics that no worker proved
+        to lose, as best_child.
+        """
+        start = time.monotonic()
+        if num_simulation is not None:
+            num_simulation = max(1, num_simulation // self.num_workers)
+        self._broadcast('search', (board_position(board), toplay, limit,
+                                   num_simulation, exploration, self.leaf_rollouts,
+                                   (self.max_nodes, self.max_bytes)))
+        visits = {}
+        move_wins = {}
+        proven = {}
+        for _, conn in self._workers:
+            moves, worker_visits, worker_wins, worker_proven = conn.recv()
+            for move, n, wins, proof in zip(moves.tolist(), worker_visits, worker_wins,
+                                            worker_proven.tolist()):
+                visits[move] = visits.get(move, 0) + n
+                move_wins[move] = move_wins.get(move, 0) + wins
+                if proof != NOT_PROVEN:
+                    proven[move] = proof
+        self.toplay = toplay
+        if not visits:
+            return None
+        won = [move for move in visits if proven.get(move) == PROVEN_WIN]
+        playable = [move for move in visits if proven.get(move) != PROVEN_LOSS]
+        if won:
+            move = max(won, key=visits.get)
+        elif playable:
+            move = max(playable, key=visits.get)
+        else:
+            move = max(visits, key=visits.get)
+        if self.verbose:
+            self.print_stat(board, visits, move_wins, toplay, time.monotonic() - start)
+        assert board.is_legal_gomoku(move, toplay)
+        return move
+
+    def update_with_move(self, last_move, board = None):
+        """
+        Advance the tree of every worker by last_move,
+        as MCTS.update_with_move
+        """
+        position = None if board is None else board_position(board)
+        self._broadcast('update', (last_move, position))
+        if board is None:
+            self.toplay = GoBoardUtil.opponent(self.toplay)
+        else:
+            self.toplay = board.current_player
+
+    def memory_usage(self):
+        """
+        Number of nodes of the trees of all workers and the bytes they take
+        """
+        self._broadcast('memory')
+        usage = [conn.recv() for _, conn in self._workers]
+        return sum(nodes for nodes, _ in usage), sum(used for _, used in usage)
+
+    def reset(self):
+        """
+        Start a new tree in every worker, keeping the processes
+        """
+        self._broadcast('reset')
+        self.toplay = BLACK
+
+    def close(self):
+        """
+        Stop the worker processes
+        """
+        self._broadcast('stop')
+        for process, conn in self._workers:
+            process.join()
+            conn.close()
+        self._workers = []
+
+    def print_stat(self, board, visits, move_wins, color, seconds):
+        total = sum(visits.values())
+        sys.stderr.write("{} workers, {:.0f} merged root visits in {:.2f}s \n"
+                         .format(self.num_workers, total, seconds))
+        stats = []
+        for move, n in visits.items():
+            wins = move_wins[move]
+            win_rate = round(float(wins) / float(n), 2) if n else 0
+            pointString = format_point(point_to_coord(move, board.size))
+            stats.append((pointString, win_rate, int(wins), int(n)))
+        sys.stderr.write("Statistics: {} \n".format(sorted(stats, key=lambda i: i[3], reverse=True)[:10]))
+        sys.stderr.flush()
+
+
+def select_virtual(store, node, exploration):
+    """
+    Same as MCTS.select, with the virtual losses counted as visits
+    that the player to move has lost. Only selects among the children that
+    have been created, and among those not proven lost while there is one.
+    Reads the statistics without locking.
+    """
+    children = store.children(node)
+    visits = store.visits[children]
+    wins = store.wins[children]
+    visits = visits + store.virtual_loss[children]
+    parent_visits = store.visits[node] + store.virtual_loss[node]
+    log_parent = np.log(parent_visits) if parent_visits > 0 else 0.0
+    safe_visits = np.maximum(visits, 1.0)
+    uct = wins / safe_visits + exploration * np.sqrt(log_parent / safe_visits)
+    uct[visits == 0] = np.inf
+    lost = store.proven[children] == PROVEN_LOSS
+    if lost.any() and not lost.all():
+        uct[lost] = -np.inf
+    return int(children[uct.argmax()])
+
+
+class TreeParallelMCTS(MCTS):
+    """
+    MCTS whose playouts run in num_workers processes on one shared tree.
+    The tree holds at most capacity nodes and CANDIDATES_PER_NODE candidate
+    moves per node; when it is full, no nodes are added but playouts continue.
+    This fixed capacity is its memory bound, see tree_capacity; max_nodes
+    and max_bytes are not used for pruning.
+    """
+    def __init__(self, num_workers, capacity=TREE_CAPACITY, seed=None):
+        assert num_workers >= 1
+        MCTS.__init__(self)
+        # selection is plain UCT: rave, priors and widening stay off
+        self.num_workers = num_workers
+        self._store = SharedNodeStore(capacity, CANDIDATES_PER_NODE * capacity)
+        self._root = self._store.new_node()
+        if seed is None:
+            seed = random.randrange(2 ** 31)
+        context = multiprocessing.get_context('fork')
+        self._locks = [context.Lock() for _ in range(NUM_LOCKS)]
+        self._alloc_lock = context.Lock()
+        self._workers = []
+        for i in range(num_workers):
+            conn, child_conn = context.Pipe()
+            process = context.Process(target=self._work, args=(child_conn, seed + i))
+            process.daemon = True
+            process.start()
+            child_conn.close()
+            self._workers.append((process, conn))
+        # free the shared memory even if close is not called
+        atexit.register(self.close)
+
+    def _work(self, conn, seed):
+        """
+        Worker process loop. Commands arrive on conn as (name, args) tuples:
+        search -- run playouts from the root, send back how many
+        stop   -- leave the loop
+        """
+        random.seed(seed)
+        np.random.seed(seed)
+        while True:
+            command, args = conn.recv()
+            if command == 'search':
+                position, toplay, deadline, max_visits, exploration, leaf_rollouts = args
+                self.exploration = exploration
+                self.leaf_rollouts = leaf_rollouts
+                board = board_from_position(position)
+                conn.send(self._search(board, toplay, deadline, max_visits))
+            elif command == 'stop':
+                break
+        conn.close()
+
+    def _search(self, board, toplay, deadline, max_visits):
+        """
+        Run playouts until the deadline, or until the root has max_visits
+        visits if that is not None. The deadline is a time.monotonic() value,
+        which is the same clock in every process.
+        """
+        store = self._store
+        n = 0
+        while max_visits is None or store.visits[self._root] < max_visits:
+            self._playout(board, toplay)
+            n += 1
+            if time.monotonic() >= deadline or store.proven[self._root] != NOT_PROVEN:
+                break
+        return n
+
+    def _lock(self, node):
+        return self._locks[node % NUM_LOCKS]
+
+    def _expand(self, node, board):
+        """
+        Expands node with every empty point as a candidate move, without
+        prior statistics, unless another worker has already done it
+        or the store is full.
+        """
+        store = self._store
+        with self._lock(node):
+            if store.is_expanded(node):
+                return
+            moves = board.get_empty_points()
+            with self._alloc_lock:
+                if store.has_room(0, len(moves)):
+                    store.add_candidates(node, moves)
+
+    def _select(self, node):
+        """
+        Creates the child for the next candidate move of node if there is one
+        and the store has room, else selects among the children with
+        select_virtual. Returns NO_NODE if node has no child yet.
+        """
+        store = self._store
+        if store.can_add_child(node):
+            with self._lock(node):
+                if store.can_add_child(node):
+                    with self._alloc_lock:
+                        if store.has_room(1):
+                            return store.add_child(node)
+        if store.num_children[node] == 0:
+            return NO_NODE
+        return select_virtual(store, node, self.exploration)
+
+    def _add_virtual_loss(self, node):
+        with self._lock(node):
+            self._store.virtual_loss[node] += VIRTUAL_LOSS
+
+    def _playout(self, board, color):
+        """
+        Same as MCTS._playout on the shared tree: descend with _select,
+        adding a virtual loss to each node on the path, then replace the
+        virtual losses by the result of the rollout. A move that makes five
+        proves its node won and proofs are propagated under the allocation
+        lock; the descent stops at proven nodes, which take their value from
+        the proof instead of a rollout.
+        """
+        store = self._store
+        root_moves = len(board.moves)
+        node = self._root
+        path = [node]
+        self._add_virtual_loss(node)
+        while store.proven[node] == NOT_PROVEN:
+            if not store.is_expanded(node):
+                self._expand(node, board)
+            if store.is_leaf(node):
+                break
+            created = store.num_nodes
+            node = self._select(node)
+            if node == NO_NODE:
+                node = path[-1]
+                break
+            self._add_virtual_loss(node)
+            path.append(node)
+            move = int(store.move[node])
+            assert board.is_legal_gomoku(move, color)
+            board.play_move_gomoku(move, color)
+            color = GoBoardUtil.opponent(color)
+            if board.get_winner() is not None:
+                with self._alloc_lock:
+                    store.proven[node] = PROVEN_WIN
+                    store.propagate_proof(node, len(board.get_empty_points()))
+                break
+            # stop at a node created during this descent, by this worker or
+            # another one, or whose first rollout is still running elsewhere;
+            # children start without prior visits here, see _expand
+            if node >= created or store.visits[node] == 0:
+                break
+        if store.proven[node] != NOT_PROVEN:
+            # color is to play at node, the other player made the move into it
+            black_won = (store.proven[node] == PROVEN_WIN) == (color != BLACK)
+            leaf_value = self.leaf_rollouts if black_won else 0
+        elif self.leaf_rollouts > 1:
+            leaf_value = self._evaluate_batch(board, self.leaf_rollouts)
+        else:
+            leaf_value = self._evaluate_rollout(board, color)
+        # as NodeStore.update_path, under the lock of each node
+        wins = self.leaf_rollouts - leaf_value if color == BLACK else leaf_value
+        for node in reversed(path):
+            with self._lock(node):
+                store.visits[node] += self.leaf_rollouts
+                store.wins[node] += wins
+                store.virtual_loss[node] -= VIRTUAL_LOSS
+            wins = self.leaf_rollouts - wins
+        board.undo_to(root_moves)
+
+    def get_move(self,
+            board,
+            toplay,
+            limit,
+            num_simulation,
+            exploration):
+        """
+        Runs playouts in every worker until the deadline derived from limit,
+        or until num_simulation playouts are done, whichever comes first.
+        Returns a move proven to win if there is one, else the most visited
+        move that is not proven to lose, as MCTS.get_move.
+        """
+        store = self._store
+        if self.toplay != toplay or self._root_hash not in (None, board.get_hash()):
+            sys.stderr.write("Dumping the subtree! \n")
+            sys.stderr.flush()
+            self._new_tree()
+        self._root_hash = board.get_hash()
+        reused = store.visits[self._root]
+        self.toplay = toplay
+        self.exploration = exploration
+        start = time.monotonic()
+        deadline = search_deadline(start, limit)
+        max_visits = None
+        if num_simulation is not None:
+            max_visits = store.visits[self._root] + num_simulation * self.leaf_rollouts
+        self._broadcast('search', (board_position(board), toplay, deadline,
+                                   max_visits, exploration, self.leaf_rollouts))
+        n = sum(conn.recv() for _, conn in self._workers)
+        if self.verbose:
+            sys.stderr.write("{} workers, {} playouts in {:.2f}s, {:.0f} root visits reused{} \n"
+                             .format(self.num_workers, n, time.monotonic() - start, reused,
+                                     self._proof_message(self._root)))
+            sys.stderr.flush()
+        best = best_child(store, self._root)
+        if best == NO_NODE:
+            return None
+        move = int(store.move[best])
+        if self.verbose:
+            self.print_stat(board, self._root, toplay)
+        assert board.is_legal_gomoku(move, toplay)
+        return move
+
+    def _new_tree(self):
+        self._store.clear()
+        self._root = self._store.new_node()
+
+    def _broadcast(self, command, args=None):
+        for _, conn in self._workers:
+            conn.send((command, args))
+
+    def update_with_move(self, last_move, board = None):
+        """
+        Keep the subtree below last_move, compacted to the start of the shared store,
+        under the same conditions as MCTS.update_with_move
+        """
+        store = self._store
+        child = NO_NODE
+        if board is None or self._root_hash == hash_before_move(board, last_move):
+            child = store.find_child(self._root, last_move)
+        if child != NO_NODE:
+            store.load(store.subtree(child))
+            self._root = 0
+        else:
+            self._new_tree()
+        if board is None:
+            self._root_hash = None
+            self.toplay = GoBoardUtil.opponent(self.toplay)
+        else:
+            self._root_hash = board.get_hash()
+            self.toplay = board.current_player
+
+    def reset(self):
+        """
+        Start a new tree, keeping the processes
+        """
+        self._new_tree()
+        self._root_hash = None
+        self.toplay = BLACK
+        self.saved_time = 0.0
+
+    def close(self):
+        """
+        Stop the worker processes and free the shared store
+        """
+        if self._store is None:
+            return
+        self._broadcast('stop')
+        for process, conn in self._workers:
+            process.join()
+            conn.close()
+        self._workers = []
+        self._store.release()
+        self._store = None
+        atexit.unregister(self.close)
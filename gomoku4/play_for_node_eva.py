@@ -4,13 +4,12 @@ helper class for playGame in MCTS.py file
 
 
 from board_util import GoBoardUtil, BLACK, WHITE, PASS, EMPTY
-from simple_board import SimpleGoBoard
+from gomoku_board import GomokuBoard
 import random
 
 
 def undo(board,move):
-    board.board[move]=EMPTY
-    board.current_player=GoBoardUtil.opponent(board.current_player)
+    board.undo_move_gomoku(move)
 
 def play_move(board, move, color):
     board.play_move_gomoku(move, color)
@@ -54,37 +53,31 @@ class Play_for_evaluate(object):
         return super().__init__(*args, **kwargs)
 
 
+    @staticmethod
+    def rollout(board):
+        """
+        Random game from board until the first five or a full board.
+        The empty points are shuffled once and played in that order; after
+        each ply only the five through the last move is checked, by
+        play_move_gomoku. The moves stay on board, take them back with undo_to.
+        Returns (winner, number of plies); winner is None for a draw.
+        """
+        moves = board.get_empty_points()
+        random.shuffle(moves)
+        plies = 0
+        for move in moves:
+            if board.get_winner() is not None:
+                break
+            board.play_move_gomoku(move, board.current_player)
+            plies += 1
+        return board.get_winner(), plies
+
     @staticmethod
     def playGame(board, toPlay):
         """
-        run simulation game 
+        run simulation game, return the winner or None for a draw
         """
-        limit = 1000
-        simulation_moves=[]
-        #cboard = board.copy()
-        nuPasses = 0
-        for _ in range(limit):
-        #while True:
-            color = board.current_player
-            playout_move = GoBoardUtil.generate_random_move_gomoku(board)
-            if playout_move != None:
-                if_legal = board.play_move_gomoku(playout_move, color)
-                #simulation_moves.append(playout_move)
-                #_, res = board.check_game_end_gomoku()
-                #print(if_legal)
-                if not if_legal:
-                    print("illegal move#")
-                #assert if_legal
-            else:
-                #board.play_move_gomoku(playout_move, color)
-                if playout_move == PASS:
-                    break
-                    #nuPasses +=1
-                #else nuPasses = 0
-                #if nuPasses >= 2:
-                 #   break
-            color = GoBoardUtil.opponent(color)
-        _, winner = board.check_game_end_gomoku()
+        winner, _ = Play_for_evaluate.rollout(board)
         return winner
 
     @staticmethod
@@ -13,6 +13,7 @@ import numpy as np
 from board_util import GoBoardUtil, BLACK, WHITE, EMPTY, BORDER, \
                        PASS, is_black_white, coord_to_point, where1d, \
                        MAXSIZE, NULLPOINT
+from board_geometry import get_geometry
 import alphabeta
 
 class SimpleGoBoard(object):
@@ -77,54 +78,39 @@ class SimpleGoBoard(object):
         The board is stored as a one-dimensional array
         See GoBoardUtil.coord_to_point for explanations of the array encoding
         """
-        self.size = size
-        self.NS = size + 1
-        self.WE = 1
+        self._set_geometry(get_geometry(size))
         self.ko_recapture = None
         self.current_player = BLACK
-        self.maxpoint = size * size + 3 * (size + 1)
-        self.board = np.full(self.maxpoint, BORDER, dtype = np.int32)
+        self.winner = None
+        self.winning_point = None
+        self.moves = []
+        self.stone_hash = 0
+        self.board = self.geometry.empty_board.copy()
         self.liberty_of = np.full(self.maxpoint, NULLPOINT, dtype = np.int32)
-        self._initialize_empty_points(self.board)
-        self._initialize_neighbors()
-        self.index = {
-            "horizontal1":(9,10,11,12,13,14,15),
-            "horizontal2":(17,18,19,20,21,22,23),
-            "horizontal3":(25,26,27,28,29,30,31),
-            "horizontal4":(33,34,35,36,37,38,39),
-            "horizontal5":(41,42,43,44,45,46,47),
-            "horizontal6":(49,50,51,52,53,54,55),
-            "horizontal7":(57,58,59,60,61,62,63),
-
-            "vertical1":(9,17,25,33,41,49,57),
-            "vertical2":(10,18,26,34,42,50,58),
-            "vertical3":(59,51,42,35,27,19,11),
-            "vertical4":(12,20,28,36,44,52,60),
-            "vertical5":(13,21,29,37,45,53,61),
-            "vertical6":(14,22,30,38,46,54,62),
-            "vertical7":(15,23,31,35,47,55,63),
-
-            "SWtoNE1":(11,20,29,38,47),
-            "SWtoNE2":(10,19,28,37,46,55),
-            "SWtoNE3":(9,18,27,36,45,54,63),
-            "SWtoNE4":(17,26,35,44,53,62),
-            "SWtoNE5":(25,34,43,52,61),
-
-            "SEtoNW1":(13,20,27,34,41),
-            "SEtoNW2":(14,21,28,35,42,49),
-            "SEtoNW3":(15,22,29,36,43,50,57),
-            "SEtoNW4":(23,30,37,44,51,58),
-            "SEtoNW5":(31,38,45,52,59)
-        }
+
+    def _set_geometry(self, geometry):
+        """
+        Share the precomputed data for this board size
+        """
+        self.geometry = geometry
+        self.size = geometry.size
+        self.NS = geometry.NS
+        self.WE = geometry.WE
+        self.maxpoint = geometry.maxpoint
+        self.neighbors = geometry.neighbors
+        self.index = geometry.lines
 
     def copy(self):
-        b = SimpleGoBoard(self.size)
-        assert b.NS == self.NS
-        assert b.WE == self.WE
+        b = SimpleGoBoard.__new__(SimpleGoBoard)
+        b._set_geometry(self.geometry)
         b.ko_recapture = self.ko_recapture
         b.current_player = self.current_player
-        assert b.maxpoint == self.maxpoint
-        b.board = np.copy(self.board)
+        b.winner = self.winner
+        b.winning_point = self.winning_point
+        b.moves = self.moves[:]
+        b.stone_hash = self.stone_hash
+        b.board = self.board.copy()
+        b.liberty_of = self.liberty_of.copy()
         return b
 
     def row_start(self, row):
@@ -132,36 +118,6 @@ class SimpleGoBoard(object):
         assert row <= self.size
         return row * self.NS + 1
         
-    def _initialize_empty_points(self, board):
-        """
-        Fills points on the board with EMPTY
-        Argument
-        ---------
-        board: numpy array, filled with BORDER
-        """
-        for row in range(1, self.size + 1):
-            start = self.row_start(row)
-            board[start : start + self.size] = EMPTY
-
-    def _on_board_neighbors(self, point):
-        nbs = []
-        for nb in self._neighbors(point):
-            if self.board[nb] != BORDER:
-                nbs.append(nb)
-        return nbs
-            
-    def _initialize_neighbors(self):
-        """
-        precompute neighbor array.
-        For each point on the board, store its list of on-the-board neighbors
-        """
-        self.neighbors = []
-        for point in range(self.maxpoint):
-            if self.board[point] == BORDER:
-                self.neighbors.append([])
-            else:
-                self.neighbors.append(self._on_board_neighbors(point))
-        
     def is_eye(self, point, color):
         """
         Check if point is a simple eye for color
@@ -338,10 +294,7 @@ class SimpleGoBoard(object):
 
     def _diag_neighbors(self, point):
         """ List of all four diagonal neighbors of point """
-        return [point - self.NS - 1, 
-                point - self.NS + 1, 
-                point + self.NS - 1, 
-                point + self.NS + 1]
+        return self.geometry.diag_neighbors[point]
     
     def _point_to_coord(self, point):
         """
@@ -369,16 +322,58 @@ class SimpleGoBoard(object):
     
     def play_move_gomoku(self, point, color):
         """
-            Play a move of color on point, for the game of gomoku
+            Play a move of color on point, for the game of gomoku,
+            and push it on the move stack.
             Returns boolean: whether move was legal
             """
         assert is_black_white(color)
         assert point != PASS
         if self.board[point] != EMPTY:
             return False
+        self.moves.append((point, self.current_player))
+        self.stone_hash ^= self.geometry.zobrist[color][point]
         self.board[point] = color
         self.current_player = GoBoardUtil.opponent(color)
+        if self.winner is None and self.point_check_game_end_gomoku(point):
+            self.winner = color
+            self.winning_point = point
         return True
+
+    def undo_move(self):
+        """
+            Pop the last move played with play_move_gomoku and take it back,
+            restoring the player to move and the winner.
+            Returns the point of the move.
+            """
+        point, player = self.moves.pop()
+        self.stone_hash ^= self.geometry.zobrist[self.board[point]][point]
+        self.board[point] = EMPTY
+        self.current_player = player
+        if point == self.winning_point:
+            self.winner = None
+            self.winning_point = None
+        return point
+
+    def undo_move_gomoku(self, point):
+        """
+            Take back the stone on point, which must be the last move played.
+            """
+        assert self.moves and self.moves[-1][0] == point
+        self.undo_move()
+
+    def undo_to(self, num_moves):
+        """
+            Take back moves until only the first num_moves remain on the stack.
+            """
+        while len(self.moves) > num_moves:
+            self.undo_move()
+
+    def get_winner(self):
+        """
+            Return the color that made the first five, or None.
+            Kept up to date by play_move_gomoku, so this is O(1).
+            """
+        return self.winner
         
     def _point_direction_check_connect_gomoko(self, point, shift):
         """
@@ -389,25 +384,20 @@ class SimpleGoBoard(object):
         count = 1
         d = shift
         p = point
-        while True:
+        while count < 5:
             p = p + d
             if self.board[p] == color:
                 count = count + 1
-                if count == 5:
-                    break
             else:
                 break
         d = -d
         p = point
-        while True:
+        while count < 5:
             p = p + d
             if self.board[p] == color:
                 count = count + 1
-                if count == 5:
-                    break
             else:
                 break
-        assert count <= 5
         return count == 5
     
     def point_check_game_end_gomoku(self, point):
@@ -432,9 +422,26 @@ class SimpleGoBoard(object):
         
         return False
     
+    def get_hash(self):
+        """
+            64-bit Zobrist hash of the stones and the player to move.
+            The stone part is kept up to date by play_move_gomoku and undo_move.
+            """
+        return self.stone_hash ^ self.geometry.zobrist_to_play[self.current_player]
+
     def check_game_end_gomoku(self):
         """
             Check if the game ends for the game of Gomoku.
+            Only moves played with play_move_gomoku are tracked.
+            """
+        if self.winner is None:
+            return False, None
+        return True, self.winner
+
+    def scan_game_end_gomoku(self):
+        """
+            Check if the game ends by scanning every stone on the board.
+            Slow, kept for stones set directly on self.board and for benchmarks.
             """
         white_points = where1d(self.board == WHITE)
         black_points = where1d(self.board == BLACK)
@@ -0,0 +1,151 @@
+"""
+test_engine.py
+
+Regression tests for the search engines. Run from this directory with
+python3 -m pytest test_engine.py or python3 -m unittest test_engine.
+"""
+
+import random
+import unittest
+import numpy as np
+from board_util import BLACK, WHITE, coord_to_point
+from gomoku_board import GomokuBoard
+from MCTS import MCTS
+from node_store import NOT_PROVEN
+from Gomoku4 import GomokuSimulationPlayer
+from gtp_connection import GtpConnection
+from parallel_mcts import TreeParallelMCTS
+from transposition_mcts import TranspositionMCTS, TranspositionTable, PROBES
+
+
+def new_mcts():
+    random.seed(1)
+    np.random.seed(1)
+    mcts = MCTS()
+    mcts.verbose = False
+    return mcts
+
+
+class MemoryBudgetTest(unittest.TestCase):
+
+    def test_budget_below_root_children_stops_pruning(self):
+        # the root of the empty 7x7 board has 49 children, more than the budget
+        mcts = new_mcts()
+        mcts.max_nodes = 10
+        mcts.early_stop = False
+        mcts.get_move(GomokuBoard(7), BLACK, None, 300, 1.96)
+        self.assertEqual(mcts.num_prunes, 1)
+        self.assertTrue(mcts._budget_too_small)
+        # the next search tries again
+        mcts._set_root(GomokuBoard(7), BLACK)
+        self.assertFalse(mcts._budget_too_small)
+
+    def test_budget_is_met(self):
+        mcts = new_mcts()
+        mcts.max_nodes = 200
+        mcts.early_stop = False
+        mcts.get_move(GomokuBoard(7), BLACK, None, 1000, 1.96)
+        self.assertGreater(mcts.num_prunes, 0)
+        self.assertFalse(mcts._budget_too_small)
+        self.assertLessEqual(mcts._store.num_nodes, 200)
+
+
+class PriorsTest(unittest.TestCase):
+
+    def test_every_node_gets_a_rollout(self):
+        # black to play can make an open four, so new nodes start with priors
+        board = GomokuBoard(7)
+        for black, white in [((3, 2), (6, 6)), ((3, 3), (6, 1)), ((3, 4), (7, 4))]:
+            board.play_move_gomoku(coord_to_point(black[0], black[1], 7), BLACK)
+            board.play_move_gomoku(coord_to_point(white[0], white[1], 7), WHITE)
+        self.assertIsNotNone(board.get_pattern_moves()[1])
+        mcts = new_mcts()
+        mcts.priors = True
+        mcts.early_stop = False
+        mcts.get_move(board, BLACK, None, 50, 1.96)
+        store = mcts._store
+        # one node per playout, none passed through before its own rollout
+        self.assertEqual(store.num_nodes, 51)
+
+
+class MemoryLimitTest(unittest.TestCase):
+
+    def test_each_limit_is_kept(self):
+        player = GomokuSimulationPlayer()
+        player.set_memory_limit(max_nodes=1000)
+        player.set_memory_limit(max_bytes=2000000)
+        self.assertEqual((player.max_nodes, player.max_bytes), (1000, 2000000))
+        self.assertEqual((player.MCTS.max_nodes, player.MCTS.max_bytes), (1000, 2000000))
+        player.set_memory_limit(max_nodes=None)
+        self.assertEqual((player.max_nodes, player.max_bytes), (None, 2000000))
+
+
+class TreeParallelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mcts = TreeParallelMCTS(2, capacity = 4096, seed = 1)
+        self.mcts.verbose = False
+
+    def tearDown(self):
+        self.mcts.close()
+
+    def test_legal_move_after_update(self):
+        board = GomokuBoard(7)
+        for _ in range(3):
+            move = self.mcts.get_move(board, board.current_player, None, 200, 1.96)
+            self.assertTrue(board.is_legal_gomoku(move, board.current_player))
+            board.play_move_gomoku(move, board.current_player)
+            self.mcts.update_with_move(move, board)
+        self.assertEqual(self.mcts.saved_time, 0.0)
+
+    def test_plays_proven_win(self):
+        board = GomokuBoard(7)
+        for col in range(1, 5):
+            board.play_move_gomoku(coord_to_point(1, col, 7), BLACK)
+            board.play_move_gomoku(coord_to_point(4, col + 1, 7), WHITE)
+        move = self.mcts.get_move(board, BLACK, None, 2000, 1.96)
+        self.assertEqual(move, coord_to_point(1, 5, 7))
+        self.assertNotEqual(self.mcts._store.proven[self.mcts._root], NOT_PROVEN)
+
+
+class TranspositionTest(unittest.TestCase):
+
+    def test_has_the_mcts_attributes(self):
+        mcts = TranspositionMCTS(1 << 10)
+        for name in ['saved_time', 'early_stop', 'max_nodes', 'max_bytes',
+                     'num_prunes', 'exploration']:
+            self.assertTrue(hasattr(mcts, name), name)
+        mcts.verbose = False
+        board = GomokuBoard(7)
+        move = mcts.get_move(board, BLACK, None, 100, 1.96)
+        self.assertTrue(board.is_legal_gomoku(move, BLACK))
+
+    def test_add_keeps_the_path(self):
+        table = TranspositionTable(8)
+        path = list(range(PROBES))
+        for key in path:
+            table.add(key, 1, 1)
+        # all the slots of key 8 hold positions of the path
+        table.add(8, 1, 0, set(path + [8]))
+        self.assertEqual(table.find(8), -1)
+        for key in path:
+            self.assertGreaterEqual(table.find(key), 0)
+        table.add(8, 1, 0)
+        self.assertGreaterEqual(table.find(8), 0)
+
+
+class NewGameTest(unittest.TestCase):
+
+    def test_new_game_resets_saved_time(self):
+        player = GomokuSimulationPlayer()
+        con = GtpConnection(player, GomokuBoard(7))
+        for command, args in [(con.clear_board_cmd, []), (con.boardsize_cmd, ['9'])]:
+            player.MCTS.saved_time = 5.0
+            player.MCTS._store.new_node()
+            command(args)
+            self.assertEqual(player.MCTS.saved_time, 0.0)
+            self.assertEqual(player.MCTS._store.num_nodes, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
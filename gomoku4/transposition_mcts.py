@@ -0,0 +1,287 @@
+"""
+transposition_mcts.py
+
+MCTS on the graph of positions instead of the tree of move sequences.
+
+The statistics of a position are stored once, in a TranspositionTable
+keyed by its Zobrist hash (board.get_hash(), which includes the player to move).
+Every move order that reaches the position shares its visits and black wins.
+A playout descends from the root while the current position is in the table,
+selecting among all its moves with UCT on the statistics of the positions they
+lead to, adds the first position that is not in the table, and backs up the
+rollout result through the positions on its path.
+
+The table has a fixed number of slots. When a new position finds no free slot
+among its PROBES candidates, it replaces the one with the fewest visits among
+those not used in the current search, or among all of them if there are none.
+Positions on the path of the playout that adds it are never replaced.
+"""
+
+import sys
+import time
+import numpy as np
+from board_util import GoBoardUtil, BLACK, WHITE
+from MCTS import MCTS, search_deadline, CHECK_EVERY
+
+"""
+Number of consecutive slots a position may occupy, and the default table size
+"""
+PROBES = 4
+TABLE_SIZE = 1 << 19
+
+_zobrist_arrays = {}
+
+def zobrist_arrays(geometry):
+    """
+    geometry.zobrist as numpy uint64 arrays, one per color, computed once per size
+    """
+    arrays = _zobrist_arrays.get(geometry.size)
+    if arrays is None:
+        arrays = [np.array(keys, dtype = np.uint64) for keys in geometry.zobrist]
+        _zobrist_arrays[geometry.size] = arrays
+    return arrays
+
+
+class TranspositionTable(object):
+    """
+    Open addressing hash table of position statistics in NumPy arrays.
+    A slot is free while its visits are 0.
+    """
+    def __init__(self, capacity = TABLE_SIZE):
+        assert capacity & (capacity - 1) == 0, "capacity must be a power of 2"
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.keys = np.zeros(capacity, dtype = np.uint64)
+        self.visits = np.zeros(capacity, dtype = np.float64)
+        self.black_wins = np.zeros(capacity, dtype = np.float64)
+        self.age = np.zeros(capacity, dtype = np.int32)
+        self.generation = 0
+        self.num_entries = 0
+        self.replacements = 0
+
+    def clear(self):
+        self.keys[:] = 0
+        self.visits[:] = 0
+        self.black_wins[:] = 0
+        self.age[:] = 0
+        self.generation = 0
+        self.num_entries = 0
+        self.replacements = 0
+
+    def new_generation(self):
+        """
+        Start a new search: entries not used from now on may be replaced first
+        """
+        self.generation += 1
+
+    def _slots(self, key):
+        return [(key + i) & self.mask for i in range(PROBES)]
+
+    def find(self, key):
+        """
+        Slot of the position with hash key, or -1
+        """
+        for slot in self._slots(key):
+            if self.visits[slot] > 0 and self.keys[slot] == key:
+                return slot
+        return -1
+
+    def get_visits(self, key):
+        slot = self.find(key)
+        return self.visits[slot] if slot >= 0 else 0.0
+
+    def lookup(self, keys):
+        """
+        Visits and black wins of the positions with the hashes in the
+        uint64 array keys, 0 for positions that are not in the table
+        """
+        slots = ((keys[:, None] + np.arange(PROBES, dtype = np.uint64)) & np.uint64(self.mask)).astype(np.intp)
+        match = (self.keys[slots] == keys[:, None]) & (self.visits[slots] > 0)
+        found = match.any(axis = 1)
+        slot = slots[np.arange(len(keys)), match.argmax(axis = 1)]
+        visits = np.where(found, self.visits[slot], 0.0)
+        black_wins = np.where(found, self.black_wins[slot], 0.0)
+        return visits, black_wins
+
+    def add(self, key, visits, black_wins, keep = ()):
+        """
+        Add visits and black wins to the position with hash key,
+        inserting it if it is not in the table. The positions with hashes
+        in keep are not replaced; if all candidate slots hold one of them,
+        the position is not inserted.
+        """
+        slots = self._slots(key)
+        slot = self.find(key)
+        if slot < 0:
+            free = [s for s in slots if self.visits[s] == 0]
+            if free:
+                slot = free[0]
+                self.num_entries += 1
+            else:
+                slots = [s for s in slots if int(self.keys[s]) not in keep]
+                if not slots:
+                    return
+                slot = min(slots, key = lambda s: (self.age[s] == self.generation, self.visits[s]))
+                self.replacements += 1
+                self.visits[slot] = 0
+                self.black_wins[slot] = 0
+            self.keys[slot] = key
+        self.visits[slot] += visits
+        self.black_wins[slot] += black_wins
+        self.age[slot] = self.generation
+
+    def memory_bytes(self):
+        return self.keys.nbytes + self.visits.nbytes + self.black_wins.nbytes + self.age.nbytes
+
+
+class TranspositionMCTS(MCTS):
+    """
+    Same interface as MCTS: get_move and update_with_move.
+    The table is kept from move to move, so there is no subtree to carry over.
+    """
+    def __init__(self, table_size = TABLE_SIZE):
+        MCTS.__init__(self)
+        # positions are kept in the table, there is no tree
+        self._store = None
+        self._root = None
+        self._table = TranspositionTable(table_size)
+
+    def _child_keys(self, board, moves, color):
+        """
+        Hashes of the positions after color plays each of moves on board
+        """
+        zobrist = zobrist_arrays(board.geometry)
+        base = board.stone_hash ^ board.geometry.zobrist_to_play[GoBoardUtil.opponent(color)]
+        return zobrist[color][moves] ^ np.uint64(base)
+
+    def _select(self, board, moves, visits, color):
+        """
+        The move with the highest UCT value, and the hash and visits of the
+        position after it. visits are the visits of the position on board.
+        """
+        keys = self._child_keys(board, moves, color)
+        child_visits, wins = self._table.lookup(keys)
+        if color != BLACK:
+            wins = child_visits - wins
+        log_parent = np.log(visits) if visits > 0 else 0.0
+        safe_visits = np.maximum(child_visits, 1.0)
+        uct = wins / safe_visits + self.exploration * np.sqrt(log_parent / safe_visits)
+        uct[child_visits == 0] = np.inf
+        i = int(uct.argmax())
+        return int(moves[i]), int(keys[i]), child_visits[i]
+
+    def _playout(self, board, color):
+        """
+        Descend while the position is in the table, add the first one that is not,
+        and back up the rollout result through every position on the path.
+        The moves are taken back with undo_to before returning.
+        """
+        table = self._table
+        root_moves = len(board.moves)
+        key = board.get_hash()
+        path = [key]
+        visits = table.get_visits(key)
+        while visits > 0 and board.get_winner() is None:
+            moves = np.array(board.get_empty_points(), dtype = np.intp)
+            if len(moves) == 0:
+                break
+            move, key, visits = self._select(board, moves, visits, color)
+            board.play_move_gomoku(move, color)
+            color = GoBoardUtil.opponent(color)
+            path.append(key)
+        if self.leaf_rollouts > 1:
+            leaf_value = self._evaluate_batch(board, self.leaf_rollouts)
+        else:
+            leaf_value = self._evaluate_rollout(board, color)
+        keep = set(path)
+        for key in path:
+            table.add(key, self.leaf_rollouts, leaf_value, keep)
+        board.undo_to(root_moves)
+
+    def get_move(self,
+            board,
+            toplay,
+            limit,
+            num_simulation,
+            exploration):
+        """
+        Runs playouts until the deadline derived from limit (seconds)
+        or until num_simulation playouts are done, whichever comes first.
+        Returns the move to the most visited position.
+        """
+        table = self._table
+        self.exploration = exploration
+        table.new_generation()
+        entries = table.num_entries
+        replacements = table.replacements
+        root_visits = self._set_root(board, toplay)
+        start = time.monotonic()
+        deadline = search_deadline(start, limit)
+        board_copy = board.copy()
+        n = 0
+        while num_simulation is None or n < num_simulation:
+            self._playout(board_copy, toplay)
+            n += 1
+            if n % CHECK_EVERY == 0 and time.monotonic() >= deadline:
+                break
+        moves = np.array(board.get_empty_points(), dtype = np.intp)
+        if len(moves) == 0:
+            return None
+        visits, black_wins = table.lookup(self._child_keys(board, moves, toplay))
+        move = int(moves[int(visits.argmax())])
+        if self.verbose:
+            sys.stderr.write("{} playouts in {:.2f}s, {:.0f} root visits reused \n"
+                             .format(n, time.monotonic() - start, root_visits))
+            self.print_stat(board, moves, visits, black_wins, toplay, entries, replacements)
+        assert board.is_legal_gomoku(move, toplay)
+        return move
+
+    def _set_root(self, board, toplay):
+        """
+        The table needs no root, positions are found by their hash.
+        Returns the visits of board.
+        """
+        self.toplay = toplay
+        return self._table.get_visits(board.get_hash())
+
+    def _root_proven(self):
+        """
+        The table keeps no proofs, so the root is never proven
+        """
+        return False
+
+    def update_with_move(self, last_move, board = None):
+        if board is None:
+            self.toplay = GoBoardUtil.opponent(self.toplay)
+        else:
+            self.toplay = board.current_player
+
+    def memory_usage(self):
+        """
+        Number of positions in the table and the bytes of the table,
+        which has a fixed size
+        """
+        return self._table.num_entries, self._table.memory_bytes()
+
+    def reset(self):
+        self._table.clear()
+        self.toplay = BLACK
+        self.saved_time = 0.0
+
+    def print_stat(self, board, moves, visits, black_wins, color, entries, replacements):
+        table = self._table
+        total = table.visits[table.visits > 0].sum()
+        sys.stderr.write("Positions: {} ({} new, {} replaced), {:.1f} visits per position, "
+                         "table {:.1f} MB \n"
+                         .format(table.num_entries, table.num_entries - entries,
+                                 table.replacements - replacements,
+                                 total / max(table.num_entries, 1),
+                                 table.memory_bytes() / 1e6))
+        stats = []
+        for move, n, wins in zip(moves, visits, black_wins):
+            if color != BLACK:
+                wins = n - wins
+            win_rate = round(float(wins) / float(n), 2) if n else 0
+            stats.append((self.point_to_string(board.size, int(move)), win_rate, int(wins), int(n)))
+        sys.stderr.write("Statistics: {} \n".format(sorted(stats, key = lambda i: i[3], reverse = True)[:10]))
+        sys.stderr.flush()